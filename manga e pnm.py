@@ -4,24 +4,941 @@ import datetime
 import pytz
 import os
 import math
-from supabase import create_client
+import threading
+import time
+import sqlite3
+import uuid
+import io
+import importlib.util
+import collections
+import sys
+import argparse
+import json
+import random
+import statistics
+import bisect
+import contextlib
+import functools
+import socket
+import hashlib
+import base64
+import concurrent.futures
+import logging
+import shutil
+import httpx
+from supabase import create_client, ClientOptions
 from dotenv import load_dotenv
 from pathlib import Path
 import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# threads de fundo (flusher, fila de fotos, pré-carga...) não têm página onde
+# mostrar erro: vão para o log do servidor
+log = logging.getLogger("manga_pnm")
+
+# ==============================
+# BACKEND LOCAL (substituto do Supabase)
+# ==============================
+class RespostaLocal:
+    def __init__(self, data):
+        self.data = data
+        self.count = len(data)
+
+
+def _termos_postgrest(texto: str) -> list[str]:
+    """
+    Separa "a.eq.1,and(b.gt.2,c.lt.3)" nas vírgulas de fora dos parênteses e das aspas.
+    """
+    termos, atual, nivel, aspas = [], "", 0, False
+    for c in texto:
+        if c == '"':
+            aspas = not aspas
+        elif not aspas and c in "()":
+            nivel += 1 if c == "(" else -1
+        elif not aspas and nivel == 0 and c == ",":
+            termos.append(atual)
+            atual = ""
+            continue
+        atual += c
+    return termos + [atual]
+
+
+_OPERADORES_LOCAIS = {
+    "eq": lambda v, x: v == x,
+    "neq": lambda v, x: v != x,
+    "gt": lambda v, x: v > x,
+    "gte": lambda v, x: v >= x,
+    "lt": lambda v, x: v < x,
+    "lte": lambda v, x: v <= x,
+}
+
+
+def _filtro_postgrest(termo: str):
+    for logico, juntar in (("and(", all), ("or(", any)):
+        if termo.startswith(logico):
+            testes = [_filtro_postgrest(t) for t in _termos_postgrest(termo[len(logico):-1])]
+            return lambda linha: juntar(t(linha) for t in testes)
+
+    coluna, operador, valor = termo.split(".", 2)
+    valor = valor.strip('"')
+    comparar = _OPERADORES_LOCAIS[operador]
+
+    def teste(linha):
+        v = linha.get(coluna)
+        if v is None:
+            return False
+        return comparar(v, type(v)(valor) if isinstance(v, (int, float)) else valor)
+    return teste
+
+
+class _ConsultaLocal:
+    """
+    Só o pedaço da API do postgrest que este arquivo usa.
+    """
+
+    def __init__(self, backend, tabela: str):
+        self._backend = backend
+        self.tabela = tabela
+        self.operacao = "select"
+        self.colunas = None
+        self.filtros = []
+        self.ordem = []
+        self.limite = None
+        self.faixa = None
+        self.payload = None
+        self.on_conflict = []
+        self.ignore_duplicates = False
+
+    def select(self, colunas: str = "*", **_):
+        if colunas.strip() != "*":
+            self.colunas = [c.strip() for c in colunas.split(",")]
+        return self
+
+    def _filtro(self, coluna, teste):
+        def aplicar(linha):
+            valor = linha.get(coluna)
+            return valor is not None and teste(valor)
+        self.filtros.append(aplicar)
+        return self
+
+    def eq(self, coluna, valor):
+        return self._filtro(coluna, lambda v: str(v) == str(valor))
+
+    def neq(self, coluna, valor):
+        return self._filtro(coluna, lambda v: str(v) != str(valor))
+
+    def gt(self, coluna, valor):
+        return self._filtro(coluna, lambda v: v > valor)
+
+    def gte(self, coluna, valor):
+        return self._filtro(coluna, lambda v: v >= valor)
+
+    def lt(self, coluna, valor):
+        return self._filtro(coluna, lambda v: v < valor)
+
+    def lte(self, coluna, valor):
+        return self._filtro(coluna, lambda v: v <= valor)
+
+    def in_(self, coluna, valores):
+        valores = {str(v) for v in valores}
+        return self._filtro(coluna, lambda v: str(v) in valores)
+
+    def or_(self, filtros: str, **_):
+        testes = [_filtro_postgrest(t) for t in _termos_postgrest(filtros)]
+        self.filtros.append(lambda linha: any(t(linha) for t in testes))
+        return self
+
+    def order(self, coluna, desc: bool = False, **_):
+        self.ordem.append((coluna, desc))
+        return self
+
+    def limit(self, n: int, **_):
+        self.limite = n
+        return self
+
+    def range(self, inicio: int, fim: int, **_):
+        self.faixa = (inicio, fim)
+        return self
+
+    def insert(self, payload, **_):
+        self.operacao = "insert"
+        self.payload = payload if isinstance(payload, list) else [payload]
+        return self
+
+    def upsert(self, payload, on_conflict: str = "", ignore_duplicates: bool = False, **_):
+        self.operacao = "upsert"
+        self.payload = payload if isinstance(payload, list) else [payload]
+        self.on_conflict = [c.strip() for c in on_conflict.split(",") if c.strip()]
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def execute(self):
+        return self._backend._executar(self)
+
+
+class _BucketLocal:
+    def __init__(self, backend, bucket: str):
+        self._backend = backend
+        self.bucket = bucket
+
+    def upload(self, path: str, file: bytes, file_options: dict | None = None):
+        self._backend._esperar()
+        with self._backend._lock:
+            self._backend.arquivos[(self.bucket, path)] = bytes(file)
+        return {"Key": f"{self.bucket}/{path}"}
+
+    def get_public_url(self, path: str, options: dict | None = None) -> str:
+        return f"local://{self.bucket}/{path}"
+
+    def create_signed_url(self, path: str, expires_in: int, options: dict | None = None) -> dict:
+        self._backend._esperar()
+        url = f"local://{self.bucket}/{path}?token={uuid.uuid4().hex}&expira={int(time.time()) + expires_in}"
+        return {"signedURL": url}
+
+    def create_signed_urls(self, paths: list[str], expires_in: int, options: dict | None = None) -> list[dict]:
+        self._backend._esperar()
+        expira = int(time.time()) + expires_in
+        return [
+            {"path": p, "error": None, "signedURL": f"local://{self.bucket}/{p}?token={uuid.uuid4().hex}&expira={expira}"}
+            for p in paths
+        ]
+
+    def remove(self, paths: list[str]):
+        self._backend._esperar()
+        with self._backend._lock:
+            for p in paths:
+                self._backend.arquivos.pop((self.bucket, p), None)
+        return []
+
+    def list(self, path: str = "", options: dict | None = None):
+        self._backend._esperar()
+        prefixo = path.rstrip("/") + "/" if path else ""
+        with self._backend._lock:
+            nomes = [
+                (p[len(prefixo):], len(conteudo))
+                for (b, p), conteudo in self._backend.arquivos.items()
+                if b == self.bucket and p.startswith(prefixo) and "/" not in p[len(prefixo):]
+            ]
+        return [{"name": nome, "metadata": {"size": tamanho}} for nome, tamanho in sorted(nomes)]
+
+
+class _StorageLocal:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def from_(self, bucket: str) -> _BucketLocal:
+        return _BucketLocal(self._backend, bucket)
+
+
+class _TusLocal:
+    """
+    Upload retomável em memória, com as mesmas três operações do _TusHttp.
+    """
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._uploads = {}
+
+    def criar(self, bucket: str, caminho: str, tamanho: int, content_type: str) -> str:
+        self._backend._esperar()
+        url = f"local://upload/{uuid.uuid4().hex}"
+        with self._backend._lock:
+            self._uploads[url] = {"bucket": bucket, "caminho": caminho, "tamanho": tamanho, "dados": bytearray()}
+        return url
+
+    def posicao(self, url: str) -> int | None:
+        self._backend._esperar()
+        with self._backend._lock:
+            upload = self._uploads.get(url)
+            return None if upload is None else len(upload["dados"])
+
+    def enviar(self, url: str, posicao: int, pedaco: bytes) -> int:
+        self._backend._esperar()
+        with self._backend._lock:
+            upload = self._uploads[url]
+            if posicao != len(upload["dados"]):
+                raise RuntimeError(f"409 posição {posicao} != {len(upload['dados'])}")
+            upload["dados"] += pedaco
+            if len(upload["dados"]) >= upload["tamanho"]:
+                self._backend.arquivos[(upload["bucket"], upload["caminho"])] = bytes(upload["dados"])
+            return len(upload["dados"])
+
+
+class ClienteLocal:
+    """
+    Substituto em memória do cliente Supabase (tabelas + Storage), para rodar
+    e medir o app sem rede. Cada execute()/chamada de Storage espera
+    latencia_ms (+ até variacao_ms aleatório), simulando a ida ao servidor.
+    Selects voltam com no máximo max_linhas, como o max-rows do PostgREST.
+    """
+
+    def __init__(self, latencia_ms: float = 0, variacao_ms: float = 0, max_linhas: int | None = None):
+        self.latencia_ms = latencia_ms
+        self.variacao_ms = variacao_ms
+        self.max_linhas = max_linhas
+        self.tabelas = collections.defaultdict(list)
+        self.arquivos = {}
+        self.chamadas = collections.Counter()
+        self._ids = collections.Counter()
+        self._lock = threading.Lock()
+        self.storage = _StorageLocal(self)
+        self.tus = _TusLocal(self)
+
+    def table(self, tabela: str) -> _ConsultaLocal:
+        return _ConsultaLocal(self, tabela)
+
+    def _esperar(self):
+        atraso = self.latencia_ms + random.uniform(0, self.variacao_ms)
+        if atraso > 0:
+            time.sleep(atraso / 1000)
+
+    def _executar(self, q: _ConsultaLocal) -> RespostaLocal:
+        self._esperar()
+        with self._lock:
+            self.chamadas[(q.tabela, q.operacao)] += 1
+            linhas = self.tabelas[q.tabela]
+
+            if q.operacao in ("insert", "upsert"):
+                gravadas = []
+                for novo in q.payload:
+                    existente = None
+                    if q.operacao == "upsert" and q.on_conflict:
+                        existente = next(
+                            (l for l in linhas if all(str(l.get(c)) == str(novo.get(c)) for c in q.on_conflict)),
+                            None,
+                        )
+                    if existente is not None:
+                        if not q.ignore_duplicates:
+                            existente.update(novo)
+                            gravadas.append(dict(existente))
+                        continue
+                    self._ids[q.tabela] += 1
+                    linha = {"id": self._ids[q.tabela], **novo}
+                    linhas.append(linha)
+                    gravadas.append(dict(linha))
+                return RespostaLocal(gravadas)
+
+            resultado = [l for l in linhas if all(f(l) for f in q.filtros)]
+            for coluna, desc in reversed(q.ordem):
+                resultado.sort(key=lambda l: (l.get(coluna) is None, l.get(coluna)), reverse=desc)
+            if q.faixa:
+                resultado = resultado[q.faixa[0]:q.faixa[1] + 1]
+            if q.limite is not None:
+                resultado = resultado[:q.limite]
+            if self.max_linhas is not None:
+                resultado = resultado[:self.max_linhas]
+            if q.colunas:
+                resultado = [{c: l.get(c) for c in q.colunas} for l in resultado]
+            else:
+                resultado = [dict(l) for l in resultado]
+            return RespostaLocal(resultado)
+
+
+# ==============================
+# INSTRUMENTAÇÃO (tempo por chamada ao backend e por página)
+# ==============================
+def _percentis(amostras_ms: list[float]) -> dict:
+    if len(amostras_ms) < 2:
+        v = amostras_ms[0] if amostras_ms else 0.0
+        return {"n": len(amostras_ms), "p50": v, "p95": v, "p99": v}
+    q = statistics.quantiles(amostras_ms, n=100, method="inclusive")
+    return {"n": len(amostras_ms), "p50": q[49], "p95": q[94], "p99": q[98]}
+
+
+def _sessao_atual() -> str:
+    """
+    Id curto da sessão do Streamlit; threads de fundo (flusher, fila de fotos) não têm sessão.
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id[:8] if ctx else "fundo"
+
+
+class Metricas:
+    """
+    Histograma em processo por (operação, tabela): janela móvel para p50/p95/p99
+    no painel e contadores acumulados por faixa para o export no formato do Prometheus.
+    """
+
+    def __init__(self, posto: str, faixas_ms, janela: int):
+        self.posto = posto
+        self.faixas_ms = tuple(sorted(faixas_ms))
+        self._janela = janela
+        self._lock = threading.Lock()
+        self._amostras = {}   # (operacao, tabela) -> deque de ms (janela móvel)
+        self._faixas = {}     # (operacao, tabela) -> contagem por faixa, +Inf no fim
+        self._soma = collections.Counter()
+        self._erros = collections.Counter()
+        self.recentes = collections.deque(maxlen=janela)
+
+    def registrar(self, operacao: str, tabela: str, ms: float, erro: bool = False):
+        chave = (operacao, tabela or "")
+        with self._lock:
+            if chave not in self._amostras:
+                self._amostras[chave] = collections.deque(maxlen=self._janela)
+                self._faixas[chave] = [0] * (len(self.faixas_ms) + 1)
+            self._amostras[chave].append(ms)
+            self._faixas[chave][bisect.bisect_left(self.faixas_ms, ms)] += 1
+            self._soma[chave] += ms
+            if erro:
+                self._erros[chave] += 1
+            self.recentes.append({
+                "data_hora": datetime.datetime.now(datetime.timezone.utc),
+                "operacao": operacao,
+                "tabela": chave[1],
+                "sessao": _sessao_atual(),
+                "ms": round(ms, 1),
+                "erro": erro,
+            })
+
+    @contextlib.contextmanager
+    def medir(self, operacao: str, tabela: str = ""):
+        inicio = time.perf_counter()
+        erro = False
+        try:
+            yield
+        except Exception:
+            erro = True
+            raise
+        finally:
+            self.registrar(operacao, tabela, (time.perf_counter() - inicio) * 1000, erro)
+
+    def resumo(self) -> list[dict]:
+        with self._lock:
+            janelas = {k: list(v) for k, v in self._amostras.items()}
+            erros = dict(self._erros)
+        return [
+            {"operacao": op, "tabela": tabela, **_percentis(amostras), "erros": erros.get((op, tabela), 0)}
+            for (op, tabela), amostras in sorted(janelas.items())
+        ]
+
+    def mais_lentas(self, n: int = 10) -> list[dict]:
+        with self._lock:
+            recentes = list(self.recentes)
+        return sorted(recentes, key=lambda r: r["ms"], reverse=True)[:n]
+
+    def prometheus(self) -> str:
+        """
+        Texto no formato de exposição do Prometheus (histogram + counter de erros).
+        """
+        def rotulos(op, tabela, extra=""):
+            return f'operacao="{op}",tabela="{tabela}",posto="{self.posto}"{extra}'
+
+        with self._lock:
+            faixas = {k: list(v) for k, v in self._faixas.items()}
+            soma = dict(self._soma)
+            erros = dict(self._erros)
+
+        linhas = [
+            "# HELP manga_pnm_operacao_ms Duração das chamadas ao backend e das páginas (ms)",
+            "# TYPE manga_pnm_operacao_ms histogram",
+        ]
+        for (op, tabela), contagens in sorted(faixas.items()):
+            acumulado = 0
+            for limite, c in zip(self.faixas_ms + (float("inf"),), contagens):
+                acumulado += c
+                le = "+Inf" if limite == float("inf") else f"{limite:g}"
+                extra = f',le="{le}"'
+                linhas.append(f"manga_pnm_operacao_ms_bucket{{{rotulos(op, tabela, extra)}}} {acumulado}")
+            linhas.append(f"manga_pnm_operacao_ms_sum{{{rotulos(op, tabela)}}} {soma[(op, tabela)]:.3f}")
+            linhas.append(f"manga_pnm_operacao_ms_count{{{rotulos(op, tabela)}}} {acumulado}")
+        linhas += [
+            "# HELP manga_pnm_operacao_erros_total Chamadas que terminaram em exceção",
+            "# TYPE manga_pnm_operacao_erros_total counter",
+        ]
+        for (op, tabela) in sorted(faixas):
+            linhas.append(f"manga_pnm_operacao_erros_total{{{rotulos(op, tabela)}}} {erros.get((op, tabela), 0)}")
+        return "\n".join(linhas) + "\n"
+
+    def exportar(self, caminho: Path, extra: str = ""):
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        tmp = caminho.with_suffix(".tmp")
+        tmp.write_text(self.prometheus() + extra, encoding="utf-8")
+        os.replace(tmp, caminho)
+
+
+class _ConsultaInstrumentada:
+    """
+    Envolve o builder do postgrest: repassa a cadeia (.select().eq()...) e mede o .execute().
+    """
+
+    OPERACOES = {"select", "insert", "upsert", "update", "delete"}
+
+    def __init__(self, consulta, metricas: Metricas, tabela: str):
+        self._consulta = consulta
+        self._metricas = metricas
+        self._tabela = tabela
+        self._operacao = "select"
+
+    def __getattr__(self, nome):
+        attr = getattr(self._consulta, nome)
+        if not callable(attr):
+            return attr
+
+        def chamar(*args, **kwargs):
+            if nome == "execute":
+                with self._metricas.medir(self._operacao, self._tabela):
+                    return attr(*args, **kwargs)
+            if nome in self.OPERACOES:
+                self._operacao = nome
+            self._consulta = attr(*args, **kwargs)
+            return self
+        return chamar
+
+
+class _BucketInstrumentado:
+    def __init__(self, bucket, metricas: Metricas, nome: str):
+        self._bucket = bucket
+        self._metricas = metricas
+        self._nome = nome
+
+    def __getattr__(self, nome):
+        attr = getattr(self._bucket, nome)
+        if not callable(attr):
+            return attr
+
+        def chamar(*args, **kwargs):
+            with self._metricas.medir(f"storage.{nome}", self._nome):
+                return attr(*args, **kwargs)
+        return chamar
+
+
+class _StorageInstrumentado:
+    def __init__(self, storage, metricas: Metricas):
+        self._storage = storage
+        self._metricas = metricas
+
+    def from_(self, bucket: str) -> _BucketInstrumentado:
+        return _BucketInstrumentado(self._storage.from_(bucket), self._metricas, bucket)
+
+
+class ClienteInstrumentado:
+    """
+    Mesma cara do cliente do Supabase (ou do ClienteLocal); toda chamada de tabela
+    e de Storage passa pelas Metricas. O cliente original fica em .interno.
+    """
+
+    def __init__(self, cliente, metricas: Metricas):
+        self.interno = cliente
+        self.metricas = metricas
+
+    def table(self, nome: str) -> _ConsultaInstrumentada:
+        return _ConsultaInstrumentada(self.interno.table(nome), self.metricas, nome)
+
+    @property
+    def storage(self) -> _StorageInstrumentado:
+        return _StorageInstrumentado(self.interno.storage, self.metricas)
+
+    def __getattr__(self, nome):
+        return getattr(self.interno, nome)
+
+
+@st.cache_resource
+def _metricas() -> Metricas:
+    return Metricas(POSTO, METRICAS_FAIXAS_MS, METRICAS_JANELA)
+
+
+@st.cache_resource
+def _exportador_metricas() -> Path:
+    """
+    Regrava METRICAS_EXPORT de tempos em tempos (textfile collector do node_exporter
+    ou qualquer coisa que leia o formato do Prometheus).
+    """
+    def loop():
+        while True:
+            time.sleep(METRICAS_EXPORT_SEG)
+            try:
+                _metricas().exportar(METRICAS_EXPORT, _cache_compartilhado().prometheus())
+            except OSError:
+                pass
+
+    threading.Thread(target=loop, name="metricas-export", daemon=True).start()
+    return METRICAS_EXPORT
+
+
+def _medido(operacao: str, tabela: str = ""):
+    """
+    Decorador: mede a função inteira (callbacks, páginas) nas Metricas do processo.
+    """
+    def decorar(funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            with _metricas().medir(operacao, tabela):
+                return funcao(*args, **kwargs)
+        return medida
+    return decorar
+
+
+def painel_metricas():
+    """
+    Painel de admin na barra lateral (METRICAS_PAINEL=1): tempos desta instância.
+    """
+    metricas = _metricas()
+    with st.sidebar.expander("📈 Tempos (admin)"):
+        resumo = metricas.resumo()
+        if not resumo:
+            st.caption("Sem medições ainda.")
+            return
+        st.dataframe(
+            pd.DataFrame(resumo).round({"p50": 1, "p95": 1, "p99": 1}),
+            hide_index=True, use_container_width=True,
+        )
+        st.caption("Mais lentas (janela recente)")
+        st.dataframe(pd.DataFrame(metricas.mais_lentas(10)), hide_index=True, use_container_width=True)
+        cache = _cache_compartilhado()
+        if estatisticas := cache.estatisticas():
+            st.caption("Cache compartilhado (leituras deste processo)")
+            st.dataframe(pd.DataFrame(estatisticas), hide_index=True, use_container_width=True)
+        st.download_button(
+            "⬇️ Prometheus (texto)", metricas.prometheus() + cache.prometheus(),
+            file_name="metricas.prom", mime="text/plain",
+        )
+
+
+# ==============================
+# RESILIÊNCIA (prazos, novas tentativas, disjuntor)
+# ==============================
+@st.cache_resource
+def _backend_indisponivel() -> type:
+    """
+    A classe vem do cache do processo, como o cliente que a levanta: cada rerun
+    reexecuta este arquivo, e uma classe declarada aqui seria outra a cada vez
+    (o `except` da página não pegaria a exceção do cliente criado antes).
+    """
+
+    class BackendIndisponivel(RuntimeError):
+        """
+        Sem resposta dentro do prazo, ou disjuntor aberto: quem chama usa o que
+        já tem (journal, buffer) e mostra o posto como offline.
+        """
+
+    return BackendIndisponivel
+
+
+BackendIndisponivel = _backend_indisponivel()
+
+
+def _falha_de_rede(e: Exception) -> bool:
+    """
+    Falhas que dizem "o servidor não está respondendo" (contam no disjuntor e
+    merecem nova tentativa). Erro devolvido pelo servidor não entra aqui.
+    """
+    return isinstance(e, (BackendIndisponivel, TimeoutError, ConnectionError, httpx.TransportError))
+
+
+class Disjuntor:
+    """
+    Abre depois de `limite` falhas de rede seguidas: por `aberto_seg` toda
+    chamada falha na hora. Depois deixa passar uma de teste (meio-aberto);
+    se ela der certo, fecha.
+    """
+
+    def __init__(self, nome: str, limite: int, aberto_seg: float):
+        self.nome = nome
+        self.limite = limite
+        self.aberto_seg = aberto_seg
+        self._lock = threading.Lock()
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._testando = False
+
+    @property
+    def estado(self) -> str:
+        with self._lock:
+            if self._falhas < self.limite:
+                return "fechado"
+            return "aberto" if time.monotonic() < self._aberto_ate else "meio-aberto"
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self._falhas < self.limite:
+                return True
+            if time.monotonic() < self._aberto_ate or self._testando:
+                return False
+            self._testando = True
+            return True
+
+    def sucesso(self):
+        with self._lock:
+            self._falhas = 0
+            self._testando = False
+
+    def falha(self):
+        with self._lock:
+            self._falhas += 1
+            self._testando = False
+            if self._falhas >= self.limite:
+                self._aberto_ate = time.monotonic() + self.aberto_seg
+
+    def sem_veredito(self):
+        """
+        Quem chamou desistiu antes de a chamada terminar: não conta para nenhum
+        lado, só libera a vaga de teste do meio-aberto.
+        """
+        with self._lock:
+            self._testando = False
+
+
+class OrcamentoTentativas:
+    """
+    Novas tentativas limitadas a uma fração das chamadas (com uma reserva
+    inicial): com o servidor lento, os postos não multiplicam a carga.
+    """
+
+    def __init__(self, fracao: float, reserva: float):
+        self.fracao = fracao
+        self.reserva = reserva
+        self._saldo = reserva
+        self._lock = threading.Lock()
+
+    def chamada(self):
+        with self._lock:
+            self._saldo = min(self.reserva, self._saldo + self.fracao)
+
+    def gastar(self) -> bool:
+        with self._lock:
+            if self._saldo < 1:
+                return False
+            self._saldo -= 1
+            return True
+
+
+class _ConsultaResiliente:
+    """
+    Envolve o builder do postgrest: repassa a cadeia e entrega o .execute() ao ClienteResiliente.
+    """
+
+    def __init__(self, consulta, cliente: "ClienteResiliente"):
+        self._consulta = consulta
+        self._cliente = cliente
+        self._operacao = "select"
+
+    def __getattr__(self, nome):
+        attr = getattr(self._consulta, nome)
+        if not callable(attr):
+            return attr
+
+        def chamar(*args, **kwargs):
+            if nome == "execute":
+                return self._cliente.executar("postgrest", self._operacao, lambda: attr(*args, **kwargs))
+            if nome in _ConsultaInstrumentada.OPERACOES:
+                self._operacao = nome
+            self._consulta = attr(*args, **kwargs)
+            return self
+        return chamar
+
+
+class _BucketResiliente:
+    def __init__(self, bucket, cliente: "ClienteResiliente"):
+        self._bucket = bucket
+        self._cliente = cliente
+
+    def __getattr__(self, nome):
+        attr = getattr(self._bucket, nome)
+        # get_public_url e afins só montam texto: não passam pelo prazo
+        if not callable(attr) or nome not in ClienteResiliente.STORAGE_REDE:
+            return attr
+
+        def chamar(*args, **kwargs):
+            return self._cliente.executar("storage", nome, lambda: attr(*args, **kwargs))
+        return chamar
+
+
+class _StorageResiliente:
+    def __init__(self, storage, cliente: "ClienteResiliente"):
+        self._storage = storage
+        self._cliente = cliente
+
+    def from_(self, bucket: str) -> _BucketResiliente:
+        return _BucketResiliente(self._storage.from_(bucket), self._cliente)
+
+
+class ClienteResiliente:
+    """
+    Mesma cara do cliente do Supabase (ou do ClienteLocal). Cada execute() e
+    chamada de Storage tem um prazo total, tentativas incluídas; falha de rede
+    em operação idempotente é tentada de novo com espera exponencial limitada,
+    dentro do orçamento; um disjuntor por serviço (postgrest, storage) corta
+    as chamadas enquanto o servidor não responde. O cliente original fica em .interno.
+    """
+
+    STORAGE_REDE = {"upload", "download", "list", "remove", "move", "copy", "create_signed_url", "create_signed_urls"}
+    # upsert on_conflict e upload com upsert=True repetem sem efeito colateral; insert não
+    IDEMPOTENTES = {"select", "upsert", "update", "delete", "upload_posicao"} | STORAGE_REDE
+
+    def __init__(self, cliente, prazos_seg: dict, tentativas: int, espera_base_seg: float, espera_max_seg: float,
+                 orcamento: OrcamentoTentativas, disjuntor_falhas: int, disjuntor_aberto_seg: float, workers: int = 16):
+        self.interno = cliente
+        self.prazos_seg = prazos_seg
+        self.tentativas = tentativas
+        self.espera_base_seg = espera_base_seg
+        self.espera_max_seg = espera_max_seg
+        self.orcamento = orcamento
+        self.disjuntores = {
+            servico: Disjuntor(servico, disjuntor_falhas, disjuntor_aberto_seg) for servico in ("postgrest", "storage")
+        }
+        self._local = threading.local()
+        # a chamada roda aqui; quem pediu espera só até o prazo (a resposta atrasada é descartada)
+        self._pool = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="backend")
+
+    def table(self, nome: str) -> _ConsultaResiliente:
+        return _ConsultaResiliente(self.interno.table(nome), self)
+
+    @property
+    def storage(self) -> _StorageResiliente:
+        return _StorageResiliente(self.interno.storage, self)
+
+    def __getattr__(self, nome):
+        return getattr(self.interno, nome)
+
+    @property
+    def offline(self) -> bool:
+        return self.disjuntores["postgrest"].estado != "fechado"
+
+    @contextlib.contextmanager
+    def prazo(self, segundos: float):
+        """
+        Prazo para o bloco inteiro (todas as leituras desta thread dentro dele,
+        paginação incluída) — leituras no caminho da tela. Escritas seguem só o próprio prazo.
+        """
+        anterior = getattr(self._local, "limite", math.inf)
+        self._local.limite = min(anterior, time.monotonic() + segundos)
+        try:
+            yield
+        finally:
+            self._local.limite = anterior
+
+    def executar(self, servico: str, operacao: str, chamada):
+        disjuntor = self.disjuntores[servico]
+        tipo = "storage" if servico == "storage" else ("select" if operacao == "select" else "escrita")
+        inicio = time.monotonic()
+        limite_proprio = inicio + self.prazos_seg[tipo]
+        # escrita não fica sob o prazo da tela: cortada no meio, pode ter gravado sem a tela saber
+        limite = limite_proprio if tipo == "escrita" else min(limite_proprio, getattr(self._local, "limite", math.inf))
+        self.orcamento.chamada()
+
+        tentativa = 0
+        while True:
+            if not disjuntor.permitir():
+                raise BackendIndisponivel(f"{servico} fora do ar (disjuntor aberto) — {operacao} não enviado")
+
+            futuro = self._pool.submit(chamada)
+            try:
+                resultado = futuro.result(timeout=max(limite - time.monotonic(), 0))
+            except Exception as e:
+                erro = e
+            else:
+                disjuntor.sucesso()
+                return resultado
+
+            if not futuro.done():
+                futuro.cancel()
+                if limite < limite_proprio:
+                    # estourou o prazo da tela, não o da operação: quem decide é
+                    # o resultado da chamada, que segue rodando no pool
+                    disjuntor.sem_veredito()
+                    futuro.add_done_callback(functools.partial(self._apurar, disjuntor))
+                else:
+                    disjuntor.falha()
+                raise BackendIndisponivel(f"{servico}: {operacao} sem resposta em {limite - inicio:.1f}s") from None
+
+            if not _falha_de_rede(erro):
+                disjuntor.sucesso()  # o servidor respondeu; o erro é da requisição
+                raise erro
+
+            disjuntor.falha()
+            tentativa += 1
+            espera = min(self.espera_max_seg, self.espera_base_seg * 2 ** (tentativa - 1)) * random.uniform(0.5, 1)
+            if (
+                operacao not in self.IDEMPOTENTES
+                or tentativa >= self.tentativas
+                or time.monotonic() + espera >= limite
+                or not self.orcamento.gastar()
+            ):
+                raise erro
+            time.sleep(espera)
+
+    @staticmethod
+    def _apurar(disjuntor: Disjuntor, futuro: concurrent.futures.Future):
+        """
+        Resultado tardio de uma chamada abandonada pelo prazo da tela.
+        """
+        if futuro.cancelled():
+            return
+        erro = futuro.exception()
+        if erro is None or not _falha_de_rede(erro):
+            disjuntor.sucesso()
+        else:
+            disjuntor.falha()
+
 
 # ==============================
 # CONFIGURAÇÃO
 # ==============================
 env_path = Path(__file__).parent / "teste.env"
-load_dotenv(env_path)
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+# Timeouts do cliente HTTP (segundos)
+SUPABASE_TIMEOUT_SEG = float(os.getenv("SUPABASE_TIMEOUT_SEG", 10))
+STORAGE_TIMEOUT_SEG = int(os.getenv("STORAGE_TIMEOUT_SEG", 30))
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise RuntimeError("SUPABASE_URL / SUPABASE_KEY não encontrados no teste.env")
+# Resiliência: prazo total por operação (tentativas incluídas), espera exponencial
+# limitada entre tentativas, orçamento de tentativas e disjuntor por serviço
+PRAZOS_SEG = {"select": SUPABASE_TIMEOUT_SEG, "escrita": SUPABASE_TIMEOUT_SEG, "storage": STORAGE_TIMEOUT_SEG}
+PRAZO_TELA_SEG = float(os.getenv("PRAZO_TELA_SEG", 1))  # leituras no caminho da tela (feed, pendências, fotos)
+TENTATIVAS_MAX = 3
+ESPERA_BASE_SEG = 0.2
+ESPERA_MAX_SEG = 2
+TENTATIVAS_FRACAO = 0.1    # novas tentativas ≤ 10% das chamadas...
+TENTATIVAS_RESERVA = 10    # ...mais esta reserva
+DISJUNTOR_FALHAS = 5       # falhas de rede seguidas para abrir
+DISJUNTOR_ABERTO_SEG = 15  # tempo aberto antes da chamada de teste
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Teto de linhas por resposta do PostgREST (max-rows; 1000 no Supabase). Páginas
+# maiores seriam cortadas em silêncio, então a paginação nunca pede mais que isso
+POSTGREST_MAX_ROWS = int(os.getenv("POSTGREST_MAX_ROWS", 1000))
+
+# BACKEND=local → substituto em memória (sem rede), com latência simulada
+BACKEND = os.getenv("BACKEND", "supabase")
+LATENCIA_LOCAL_MS = float(os.getenv("LATENCIA_LOCAL_MS", 0))
+LATENCIA_LOCAL_VARIACAO_MS = float(os.getenv("LATENCIA_LOCAL_VARIACAO_MS", 0))
+
+# Instrumentação: rótulo do posto, faixas do histograma (ms), janela do painel
+POSTO = os.getenv("POSTO", socket.gethostname())
+METRICAS_FAIXAS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+METRICAS_JANELA = 500       # últimas medições por operação (p50/p95/p99 do painel)
+METRICAS_PAINEL = os.getenv("METRICAS_PAINEL", "0") == "1"
+METRICAS_EXPORT_SEG = 15
+
+@st.cache_resource
+def _cliente_supabase():
+    """
+    Um cliente por processo, criado no primeiro uso e compartilhado por todas
+    as sessões: as conexões HTTP (keep-alive) são reaproveitadas entre reruns.
+    Toda chamada passa pelas Metricas do processo e pelo ClienteResiliente
+    (prazo, novas tentativas, disjuntor).
+    """
+    def montar(cliente):
+        resiliente = ClienteResiliente(
+            cliente, PRAZOS_SEG, TENTATIVAS_MAX, ESPERA_BASE_SEG, ESPERA_MAX_SEG,
+            OrcamentoTentativas(TENTATIVAS_FRACAO, TENTATIVAS_RESERVA), DISJUNTOR_FALHAS, DISJUNTOR_ABERTO_SEG,
+        )
+        return ClienteInstrumentado(resiliente, _metricas())
+
+    if BACKEND == "local":
+        return montar(ClienteLocal(LATENCIA_LOCAL_MS, LATENCIA_LOCAL_VARIACAO_MS, POSTGREST_MAX_ROWS))
+
+    load_dotenv(env_path)
+
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise RuntimeError("SUPABASE_URL / SUPABASE_KEY não encontrados no teste.env")
+
+    return montar(create_client(url, key, options=ClientOptions(
+        postgrest_client_timeout=SUPABASE_TIMEOUT_SEG,
+        storage_client_timeout=STORAGE_TIMEOUT_SEG,
+    )))
+
+supabase = _cliente_supabase()
 
 TZ = pytz.timezone("America/Sao_Paulo")
 st.set_page_config(page_title="Apontamento MANGA / PNM", layout="wide")
@@ -32,6 +949,711 @@ BUCKET_FOTOS = "checklist_fotos"
 # Bucket PUBLIC (como no seu print)
 USAR_SIGNED_URL = False
 SIGNED_URL_EXPIRA_SEG = 60 * 60  # não usado se PUBLIC
+SIGNED_URL_RENOVAR_SEG = 5 * 60  # URL com menos que isso de validade é pedida de novo
+SIGNED_URL_CACHE_MAX = 5000      # URLs guardadas no processo (LRU)
+SIGNED_URL_LOTE = 100            # caminhos por chamada de create_signed_urls
+
+# Feed de apontamentos: buffer circular + busca só do que é novo
+FEED_TAMANHO = 200      # linhas guardadas no buffer do processo
+FEED_POLL_SEG = 3       # intervalo mínimo entre buscas de delta (todas as telas juntas)
+
+# Manifesto de fotos por série: a tabela é relida só depois disso (fotos de outros postos)
+MANIFESTO_TTL_SEG = 300
+
+# Dados locais do posto (journal de leituras etc.) — o backend local usa outra pasta,
+# para leituras de teste nunca se misturarem com as do posto
+DADOS_LOCAIS = Path(os.getenv(
+    "DADOS_LOCAIS",
+    Path(__file__).parent / ("dados_locais_teste" if BACKEND == "local" else "dados_locais"),
+))
+JOURNAL_APONTAMENTOS = DADOS_LOCAIS / "apontamentos_journal.db"
+METRICAS_EXPORT = DADOS_LOCAIS / "metricas.prom"
+FLUSH_INTERVALO_SEG = 2
+FLUSH_LOTE = 200
+FLUSH_BACKOFF_MAX_SEG = 60
+JOURNAL_RETENCAO_DIAS = 7
+
+# Modo lote (doca): pares série/OP acumulados e gravados de uma vez; com o teto
+# igual a FLUSH_LOTE o lote inteiro sai num upsert só
+LOTE_MAX_PARES = FLUSH_LOTE
+
+# Índice local de séries já apontadas (semeado com o histórico recente)
+INDICE_SERIES_DIAS = 90
+INDICE_SERIES_ESPERA_MAX_SEG = 60   # semeadura que falhou: espera máxima entre tentativas
+
+# Fila de envio de fotos (Storage + tabela) em segundo plano
+FILA_FOTOS_DB = DADOS_LOCAIS / "fotos_fila.db"
+FILA_FOTOS_PASTA = DADOS_LOCAIS / "fotos_pendentes"
+FOTOS_WORKERS = 2
+FOTOS_MAX_TENTATIVAS = 8
+FOTOS_RETENCAO_DIAS = 7       # tarefas 'enviado' (e arquivos que sobraram) saem da fila depois disso
+FOTOS_PAINEL_SEG = 3          # painel de envio se atualiza sozinho
+# Arquivo maior que um pedaço sobe pelo upload retomável (TUS): queda de rede
+# continua do último pedaço confirmado. 6 MB é o tamanho que o Supabase exige.
+UPLOAD_PEDACO_BYTES = 6 * 1024 * 1024
+
+# Tratamento das fotos antes do upload (redução, recompressão, sem EXIF)
+FOTO_PROCESSAR = True
+FOTO_LADO_MAX = 1600          # px, maior lado
+FOTO_FORMATO = "WEBP"         # "WEBP" ou "JPEG"
+FOTO_QUALIDADE = 80
+MINIATURA_LADO = 320
+MINIATURA_QUALIDADE = 70
+
+# Índice de séries sem checklist: intervalo mínimo entre buscas de delta
+PENDENTES_DELTA_SEG = 10
+PENDENTES_MARGEM_SEG = 60   # sobreposição na busca de checklists (relógios diferentes)
+
+# Pré-carga em segundo plano: feed, pendências e fotos das primeiras séries pendentes
+PRECARGA_SEG = 1             # intervalo entre rodadas (menor que FEED_POLL_SEG)
+PRECARGA_SERIES = 3          # séries pendentes com fotos/URLs já carregadas
+PRECARGA_OCIOSO_SEG = 600    # sem nenhuma sessão há isso → para até a próxima aparecer
+
+# Cache compartilhado pelos processos do servidor (SQLite em disco): com vários
+# tablets/workers, feed, pendências e manifesto de fotos saem do Supabase uma vez
+# por intervalo (ou por gravação), não uma vez por processo
+CACHE_COMPARTILHADO = os.getenv("CACHE_COMPARTILHADO", "0") == "1"
+CACHE_COMPARTILHADO_DB = Path(os.getenv("CACHE_COMPARTILHADO_DB", DADOS_LOCAIS / "cache_compartilhado.db"))
+CACHE_ESPERA_SEG = PRAZO_TELA_SEG   # quanto esperar outro processo que já está buscando a mesma chave
+CACHE_RETENCAO_SEG = 3600           # entradas vencidas há mais que isso são apagadas
+
+# Checklist compacto: 1 linha por inspeção. A tabela antiga (1 linha por item)
+# continua sendo lida enquanto houver histórico nela.
+TABELA_CHECKLIST = "checklists_manga_pnm"
+TABELA_CHECKLIST_ANTIGA = "checklists_manga_pnm_detalhes"
+CHECKLIST_LER_FORMATO_ANTIGO = True
+
+# Modelos de checklist versionados: <TIPO>_v<N>.json; a pasta é reolhada no máximo a cada N s
+MODELOS_CHECKLIST_PASTA = Path(os.getenv("MODELOS_CHECKLIST_PASTA", Path(__file__).parent / "modelos_checklist"))
+MODELOS_VERIFICAR_SEG = 30
+
+# Análise: agregados por hora/dia guardados em Parquet e atualizados por delta
+ROLLUPS_PASTA = DADOS_LOCAIS / "rollups"
+ROLLUP_DELTA_SEG = 60
+ROLLUP_HISTORICO_DIAS = 400   # carga inicial (depois só delta)
+
+# ==============================
+# FEED DE APONTAMENTOS
+# ==============================
+class FeedApontamentos:
+    """
+    Buffer circular com os apontamentos mais recentes, compartilhado pelo processo.
+    Primeira carga: as últimas FEED_TAMANHO linhas; depois só id > último visto
+    (no máximo FEED_TAMANHO por busca).
+    N telas olhando a linha = uma consulta de delta a cada FEED_POLL_SEG.
+    Com o cache compartilhado, o buffer de quem buscou vale para os outros
+    processos até FEED_POLL_SEG ou até chegar apontamento novo.
+    """
+
+    def __init__(self, tamanho: int = FEED_TAMANHO):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._tamanho = tamanho
+        self._linhas = collections.deque(maxlen=tamanho)
+        self._ultimo_id = None
+        self._proxima = 0.0
+
+    def avisar_novos(self):
+        """
+        Chegou linha nova (ex.: flusher enviou um lote) → a próxima leitura busca o delta.
+        """
+        self._proxima = 0.0
+
+    def atualizar(self, cliente, antecedencia: float = 0):
+        """
+        Busca o delta se já deu FEED_POLL_SEG (ou vai dar em `antecedencia` segundos —
+        a pré-carga se adianta para as telas nunca encontrarem o feed vencido).
+        """
+        if time.monotonic() < self._proxima - antecedencia:
+            return
+        # outra sessão já está buscando → serve o que já tem
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            linhas = _cache_compartilhado().obter(
+                "feed:recentes", ("apontamentos",), FEED_POLL_SEG, lambda: self._buscar(cliente)
+            )
+            self._mesclar(linhas)
+            self._proxima = time.monotonic() + FEED_POLL_SEG
+        except Exception:
+            # falhou ou estourou o prazo: só tenta de novo no próximo ciclo, senão
+            # toda tela pagaria o prazo inteiro a cada rerun
+            self._proxima = time.monotonic() + FEED_POLL_SEG
+            raise
+        finally:
+            self._sync_lock.release()
+
+    def _buscar(self, cliente) -> list[dict]:
+        """
+        Delta no Supabase, mesclado ao buffer; devolve o buffer inteiro (o que vai para o cache).
+        """
+        consulta = cliente.table("apontamentos_manga_pnm").select("*")
+        if self._ultimo_id is not None:
+            consulta = consulta.gt("id", self._ultimo_id)
+        # o buffer só guarda as FEED_TAMANHO mais novas: o delta nunca traz mais
+        # que isso (importação em massa não vira uma resposta de milhares de linhas)
+        res = consulta.order("id", desc=True).limit(self._tamanho).execute()
+        novas = list(reversed(res.data or []))
+        if len(novas) == self._tamanho:
+            # veio o limite: pode haver buraco entre o buffer e estas → recomeça só com elas
+            with self._lock:
+                self._linhas.clear()
+        self._mesclar(novas)
+        with self._lock:
+            return list(self._linhas)
+
+    def _mesclar(self, linhas: list[dict]):
+        with self._lock:
+            vistos = {r["id"] for r in self._linhas}
+            novas = [r for r in linhas if r["id"] not in vistos]
+            if novas:
+                # fica com as FEED_TAMANHO de maior id (vindas do Supabase ou de outro processo)
+                self._linhas = collections.deque(
+                    sorted([*self._linhas, *novas], key=lambda r: r["id"]), maxlen=self._tamanho
+                )
+                self._ultimo_id = max(self._ultimo_id or 0, self._linhas[-1]["id"])
+            if self._ultimo_id is None:
+                self._ultimo_id = 0
+        # leituras de outros postos também entram no índice de séries
+        if novas:
+            _indice_series().adicionar(*(_normaliza_codigo(r["numero_serie"]) for r in novas))
+
+    def recentes(self, n: int = 20) -> list[dict]:
+        with self._lock:
+            linhas = list(self._linhas)
+        return sorted(linhas, key=lambda r: r.get("data_hora") or "", reverse=True)[:n]
+
+
+@st.cache_resource
+def _feed_apontamentos() -> FeedApontamentos:
+    # um único feed por processo (sobrevive aos reruns do Streamlit)
+    return FeedApontamentos()
+
+# ==============================
+# JOURNAL LOCAL DE APONTAMENTOS (offline-first)
+# ==============================
+def _conectar_sqlite(caminho: Path) -> sqlite3.Connection:
+    """
+    Conexão SQLite em WAL, compartilhada entre threads (protegida por lock de quem usa).
+    """
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(caminho), check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def _garantir_coluna(conn: sqlite3.Connection, tabela: str, coluna: str, tipo: str):
+    """
+    Migração mínima para bancos locais criados por versões anteriores.
+    """
+    colunas = {r["name"] for r in conn.execute(f"PRAGMA table_info({tabela})")}
+    if coluna not in colunas:
+        conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}")
+
+class JournalApontamentos:
+    """
+    Fila durável em SQLite (WAL). O leitor grava aqui e confirma na hora;
+    o FlusherApontamentos envia para o Supabase em lotes, em segundo plano.
+    """
+
+    def __init__(self, caminho: Path):
+        self._lock = threading.Lock()
+        self._conn = _conectar_sqlite(caminho)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS apontamentos_pendentes (
+                chave TEXT PRIMARY KEY,
+                numero_serie TEXT NOT NULL UNIQUE,
+                op TEXT,
+                tipo_producao TEXT,
+                usuario TEXT,
+                data_hora TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pendente',
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                proxima_tentativa REAL NOT NULL DEFAULT 0,
+                ultimo_erro TEXT
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_pendentes_status ON apontamentos_pendentes (status, proxima_tentativa)"
+        )
+        self.novo_registro = threading.Event()
+
+    def registrar(self, registro: dict) -> bool:
+        """
+        Grava a leitura. Retorna False se a série já está no journal.
+        """
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT INTO apontamentos_pendentes (chave, numero_serie, op, tipo_producao, usuario, data_hora) "
+                    "VALUES (:chave, :numero_serie, :op, :tipo_producao, :usuario, :data_hora)",
+                    registro,
+                )
+        except sqlite3.IntegrityError:
+            return False
+        self.novo_registro.set()
+        return True
+
+    def registrar_lote(self, registros: list[dict]) -> set[str]:
+        """
+        Grava várias leituras numa transação só. Retorna as séries gravadas
+        (as que já estavam no journal ficam de fora).
+        """
+        gravadas = set()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for r in registros:
+                    cur = self._conn.execute(
+                        "INSERT OR IGNORE INTO apontamentos_pendentes "
+                        "(chave, numero_serie, op, tipo_producao, usuario, data_hora) "
+                        "VALUES (:chave, :numero_serie, :op, :tipo_producao, :usuario, :data_hora)",
+                        r,
+                    )
+                    if cur.rowcount:
+                        gravadas.add(r["numero_serie"])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if gravadas:
+            self.novo_registro.set()
+        return gravadas
+
+    def situacao(self, series: list[str]) -> dict:
+        """
+        status / tentativas / ultimo_erro de cada série (só as que estão no journal).
+        """
+        if not series:
+            return {}
+        with self._lock:
+            marcadores = ",".join("?" * len(series))
+            rows = self._conn.execute(
+                f"SELECT numero_serie, status, tentativas, ultimo_erro FROM apontamentos_pendentes "
+                f"WHERE numero_serie IN ({marcadores})",
+                list(series),
+            ).fetchall()
+        return {r["numero_serie"]: dict(r) for r in rows}
+
+    def proximo_lote(self, limite: int = FLUSH_LOTE) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM apontamentos_pendentes WHERE status = 'pendente' AND proxima_tentativa <= ? "
+                "ORDER BY data_hora LIMIT ?",
+                (time.time(), limite),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def marcar(self, chaves: list[str], status: str, erro: str | None = None):
+        if not chaves:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE apontamentos_pendentes SET status = ?, ultimo_erro = ? WHERE chave = ?",
+                [(status, erro, c) for c in chaves],
+            )
+
+    def reagendar(self, chaves: list[str], erro: str):
+        """
+        Falha de rede/backend: tenta de novo com backoff exponencial (limitado).
+        """
+        agora = time.time()
+        with self._lock:
+            marcadores = ",".join("?" * len(chaves))
+            rows = self._conn.execute(
+                f"SELECT chave, tentativas FROM apontamentos_pendentes WHERE chave IN ({marcadores})", chaves
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE apontamentos_pendentes SET tentativas = ?, ultimo_erro = ?, proxima_tentativa = ? WHERE chave = ?",
+                [
+                    (r["tentativas"] + 1, erro, agora + min(FLUSH_BACKOFF_MAX_SEG, 2 ** r["tentativas"]), r["chave"])
+                    for r in rows
+                ],
+            )
+
+    def nao_enviados(self) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT numero_serie, op, tipo_producao, usuario, data_hora FROM apontamentos_pendentes "
+                "WHERE status = 'pendente' ORDER BY data_hora DESC"
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def resumo(self, desde_utc: str) -> dict:
+        with self._lock:
+            pendentes, com_erro = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tentativas > 0), 0) FROM apontamentos_pendentes WHERE status = 'pendente'"
+            ).fetchone()
+            duplicados = self._conn.execute(
+                "SELECT numero_serie FROM apontamentos_pendentes WHERE status = 'duplicado' AND data_hora >= ? "
+                "ORDER BY data_hora DESC",
+                (desde_utc,),
+            ).fetchall()
+        return {
+            "pendentes": pendentes,
+            "com_erro": com_erro,
+            "duplicados": [r["numero_serie"] for r in duplicados],
+        }
+
+    def limpar_antigos(self, dias: int = JOURNAL_RETENCAO_DIAS):
+        limite = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=dias)).isoformat()
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM apontamentos_pendentes WHERE status != 'pendente' AND data_hora < ?", (limite,)
+            )
+
+
+class IndiceSeries:
+    """
+    Séries já apontadas, em memória, semeadas do histórico recente e mantidas
+    em dia pelos deltas do feed e das pendências (leituras de outros postos).
+    Recusa releitura óbvia sem ida ao servidor; enquanto a semeadura não
+    termina, só conhece parte das séries. O upsert com on_conflict em
+    numero_serie continua sendo a garantia final entre postos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = set()
+        self.carregado = threading.Event()
+
+    def __contains__(self, numero_serie) -> bool:
+        with self._lock:
+            return numero_serie in self._series
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._series)
+
+    def adicionar(self, *series):
+        with self._lock:
+            self._series.update(series)
+
+    def semear(self, cliente, dias: int = INDICE_SERIES_DIAS, pagina: int = 1000):
+        """
+        Lê as séries do histórico recente. Falhou → tenta de novo com espera
+        crescente; carregado só é marcado quando a leitura vai até o fim.
+        """
+        tentativa = 0
+        while True:
+            desde = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=dias)).isoformat()
+            try:
+                for linhas in paginas_keyset(
+                    lambda: cliente.table("apontamentos_manga_pnm").select("id, numero_serie").gte("data_hora", desde),
+                    pagina,
+                    chave="id",
+                ):
+                    self.adicionar(*(_normaliza_codigo(r["numero_serie"]) for r in linhas))
+                break
+            except Exception as e:
+                tentativa += 1
+                espera = min(INDICE_SERIES_ESPERA_MAX_SEG, 2 ** tentativa)
+                log.warning("índice de séries: semeadura falhou (nova tentativa em %ss): %s", espera, e)
+                time.sleep(espera)
+        self.carregado.set()
+
+    def conferir(self, series: list[str]) -> set[str]:
+        """
+        Das `series`, as que o índice já sabe apontadas. Sem ida ao servidor:
+        antes de a semeadura terminar a resposta é parcial (ver `carregado`) e
+        a duplicidade que escapar é pega no envio pelo flusher (on_conflict).
+        """
+        with self._lock:
+            return {s for s in series if s in self._series}
+
+
+class FlusherApontamentos:
+    """
+    Thread de fundo: esvazia o journal em upserts em lote (uma ida por lote).
+    on_conflict=numero_serie + ignore_duplicates: o servidor devolve só as
+    linhas inseridas. As que faltam são conferidas na tabela: se a linha de lá
+    é a mesma do journal (op, usuario, data_hora), é o nosso envio anterior cuja
+    resposta se perdeu (timeout) → 'enviado'; senão outro posto apontou antes → 'duplicado'.
+    """
+
+    def __init__(self, journal: JournalApontamentos, cliente, feed: FeedApontamentos, indice: IndiceSeries):
+        self.journal = journal
+        self.cliente = cliente
+        self.feed = feed
+        self.indice = indice
+        self._thread = threading.Thread(target=self._loop, name="flusher-apontamentos", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            self.journal.novo_registro.wait(FLUSH_INTERVALO_SEG)
+            self.journal.novo_registro.clear()
+            try:
+                while self.descarregar():
+                    pass
+                self.journal.limpar_antigos()
+            except Exception:
+                log.exception("flusher de apontamentos: erro inesperado")
+
+    def descarregar(self) -> int:
+        """
+        Envia um lote. Retorna quantos registros saíram da fila.
+        """
+        lote = self.journal.proximo_lote()
+        if not lote:
+            return 0
+
+        try:
+            res = self.cliente.table("apontamentos_manga_pnm").upsert(
+                [
+                    {k: r[k] for k in ("numero_serie", "op", "tipo_producao", "usuario", "data_hora")}
+                    for r in lote
+                ],
+                on_conflict="numero_serie",
+                ignore_duplicates=True,
+            ).execute()
+        except Exception as e:
+            self.journal.reagendar([r["chave"] for r in lote], str(e))
+            return 0
+
+        inseridas = {_normaliza_codigo(r["numero_serie"]) for r in (res.data or [])}
+        faltam = [r for r in lote if r["numero_serie"] not in inseridas]
+        try:
+            nossas = self._ja_enviadas(faltam)
+        except Exception as e:
+            # sem a conferência não dá para dizer quem gravou: tenta o lote de novo
+            self.journal.marcar([r["chave"] for r in lote if r["numero_serie"] in inseridas], "enviado")
+            self.journal.reagendar([r["chave"] for r in faltam], str(e))
+            return len(lote) - len(faltam)
+        for r in faltam:
+            if r["numero_serie"] not in nossas:
+                self.journal.marcar([r["chave"]], "duplicado", f"Série {r['numero_serie']} já apontada.")
+        self.journal.marcar([r["chave"] for r in lote if r["numero_serie"] in inseridas | nossas], "enviado")
+        self.indice.adicionar(*(r["numero_serie"] for r in lote))
+        self.feed.avisar_novos()
+        if inseridas:
+            _cache_compartilhado().invalidar("apontamentos")
+        return len(lote)
+
+    def _ja_enviadas(self, registros: list[dict]) -> set[str]:
+        """
+        Séries entre `registros` cuja linha no servidor é exatamente a do journal.
+        """
+        if not registros:
+            return set()
+        res = self.cliente.table("apontamentos_manga_pnm") \
+            .select("numero_serie, op, usuario, data_hora") \
+            .in_("numero_serie", [r["numero_serie"] for r in registros]) \
+            .execute()
+        no_servidor = {_normaliza_codigo(l["numero_serie"]): l for l in (res.data or [])}
+
+        def mesma(r, l):
+            return (
+                _normaliza_codigo(l.get("op")) == r["op"]
+                and _normaliza_codigo(l.get("usuario")) == r["usuario"]
+                and datetime.datetime.fromisoformat(l["data_hora"]) == datetime.datetime.fromisoformat(r["data_hora"])
+            )
+        return {r["numero_serie"] for r in registros if r["numero_serie"] in no_servidor and mesma(r, no_servidor[r["numero_serie"]])}
+
+
+@st.cache_resource
+def _journal() -> JournalApontamentos:
+    return JournalApontamentos(JOURNAL_APONTAMENTOS)
+
+
+@st.cache_resource
+def _indice_series() -> IndiceSeries:
+    indice = IndiceSeries()
+    threading.Thread(target=indice.semear, args=(supabase,), name="indice-series", daemon=True).start()
+    return indice
+
+
+@st.cache_resource
+def _flusher() -> FlusherApontamentos:
+    return FlusherApontamentos(_journal(), supabase, _feed_apontamentos(), _indice_series())
+
+
+# ==============================
+# CACHE COMPARTILHADO ENTRE PROCESSOS
+# ==============================
+class CacheCompartilhado:
+    """
+    Cache em SQLite (WAL) lido por todos os processos do servidor: quem encontra
+    a chave vencida busca no Supabase e grava; os outros leem daqui. Cada entrada
+    guarda a versão dos grupos de que depende (apontamentos, checklists,
+    fotos:<série>); gravar nesses dados sobe a versão (invalidar) e a entrada
+    deixa de valer na hora, em todos os processos — inclusive a que estava
+    sendo buscada no momento da gravação.
+    """
+
+    def __init__(self, caminho: Path, espera_seg: float, retencao_seg: float):
+        self._lock = threading.Lock()
+        self._espera_seg = espera_seg
+        self._retencao_seg = retencao_seg
+        self._limpeza = 0.0
+        self._contagem = collections.Counter()   # (tipo, resultado) -> n, só deste processo
+        self._conn = _conectar_sqlite(caminho)
+        self._conn.execute("PRAGMA busy_timeout=2000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entradas (
+                chave TEXT PRIMARY KEY,
+                versao TEXT NOT NULL,
+                valor TEXT NOT NULL,
+                expira REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS grupos (grupo TEXT PRIMARY KEY, versao INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS travas (chave TEXT PRIMARY KEY, ate REAL NOT NULL)")
+
+    def _contar(self, chave: str, resultado: str):
+        with self._lock:
+            self._contagem[(chave.split(":", 1)[0], resultado)] += 1
+
+    def _versao(self, grupos: tuple[str, ...]) -> str:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT grupo, versao FROM grupos WHERE grupo IN ({','.join('?' * len(grupos))})", grupos
+            ).fetchall()
+        atuais = {r["grupo"]: r["versao"] for r in rows}
+        return ",".join(str(atuais.get(g, 0)) for g in grupos)
+
+    def _ler(self, chave: str, versao: str) -> tuple[bool, object]:
+        with self._lock:
+            r = self._conn.execute("SELECT versao, valor, expira FROM entradas WHERE chave = ?", (chave,)).fetchone()
+        if r is None or r["versao"] != versao or r["expira"] <= time.time():
+            return False, None
+        return True, json.loads(r["valor"])
+
+    def _travar(self, chave: str) -> bool:
+        """
+        Só um processo busca a mesma chave por vez; a trava vence sozinha em espera_seg.
+        """
+        agora = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM travas WHERE chave = ? AND ate < ?", (chave, agora))
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO travas (chave, ate) VALUES (?, ?)", (chave, agora + self._espera_seg)
+            )
+        return cur.rowcount == 1
+
+    def _gravar(self, chave: str, versao: str, valor, ttl: float):
+        agora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entradas (chave, versao, valor, expira) VALUES (?, ?, ?, ?)",
+                (chave, versao, json.dumps(valor, default=str), agora + ttl),
+            )
+            if agora >= self._limpeza:
+                self._conn.execute("DELETE FROM entradas WHERE expira < ?", (agora - self._retencao_seg,))
+                self._limpeza = agora + self._retencao_seg
+
+    def obter(self, chave: str, grupos: tuple[str, ...], ttl: float, carregar):
+        """
+        Valor da chave se ainda vale (ttl e versão dos grupos); senão carregar(),
+        grava para os outros processos e devolve. Cache com problema (disco,
+        banco travado) nunca derruba a tela: vira uma leitura direta.
+        """
+        try:
+            versao = self._versao(grupos)
+            achou, valor = self._ler(chave, versao)
+            if achou:
+                self._contar(chave, "acertos")
+                return valor
+            # outro processo já está buscando a mesma chave → espera ele gravar
+            dono = self._travar(chave)
+            if not dono:
+                limite = time.monotonic() + self._espera_seg
+                while time.monotonic() < limite:
+                    time.sleep(0.05)
+                    achou, valor = self._ler(chave, versao)
+                    if achou:
+                        self._contar(chave, "esperas")
+                        return valor
+        except sqlite3.Error as e:
+            log.warning("cache compartilhado: leitura de %s falhou: %s", chave, e)
+            self._contar(chave, "erros")
+            return carregar()
+
+        self._contar(chave, "faltas")
+        try:
+            valor = carregar()
+            try:
+                self._gravar(chave, versao, valor, ttl)
+            except sqlite3.Error as e:
+                log.warning("cache compartilhado: gravação de %s falhou: %s", chave, e)
+                self._contar(chave, "erros")
+        finally:
+            if dono:
+                self._destravar(chave)
+        return valor
+
+    def _destravar(self, chave: str):
+        try:
+            with self._lock:
+                self._conn.execute("DELETE FROM travas WHERE chave = ?", (chave,))
+        except sqlite3.Error:
+            pass  # vence sozinha
+
+    def invalidar(self, *grupos: str):
+        """
+        Os dados desses grupos mudaram no Supabase: entradas que dependem deles
+        deixam de valer para todos os processos.
+        """
+        try:
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT INTO grupos (grupo, versao) VALUES (?, 1) "
+                    "ON CONFLICT (grupo) DO UPDATE SET versao = versao + 1",
+                    [(g,) for g in grupos],
+                )
+        except sqlite3.Error as e:
+            # sem invalidar, a entrada ainda vence pelo ttl
+            log.warning("cache compartilhado: invalidar %s falhou: %s", grupos, e)
+
+    def estatisticas(self) -> list[dict]:
+        with self._lock:
+            contagem = dict(self._contagem)
+        linhas = []
+        for tipo in sorted({t for t, _ in contagem}):
+            c = {r: contagem.get((tipo, r), 0) for r in ("acertos", "esperas", "faltas", "erros")}
+            total = sum(c.values())
+            linhas.append({"tipo": tipo, **c, "taxa_acerto": round((c["acertos"] + c["esperas"]) / total, 3) if total else None})
+        return linhas
+
+    def prometheus(self) -> str:
+        with self._lock:
+            contagem = dict(self._contagem)
+        linhas = [
+            "# HELP manga_pnm_cache_compartilhado_total Leituras no cache compartilhado por resultado",
+            "# TYPE manga_pnm_cache_compartilhado_total counter",
+        ]
+        for (tipo, resultado), n in sorted(contagem.items()):
+            linhas.append(
+                f'manga_pnm_cache_compartilhado_total{{tipo="{tipo}",resultado="{resultado}",posto="{POSTO}"}} {n}'
+            )
+        return "\n".join(linhas) + "\n"
+
+
+class _SemCacheCompartilhado:
+    """
+    CACHE_COMPARTILHADO desligado: cada processo lê direto do Supabase.
+    """
+
+    def obter(self, chave, grupos, ttl, carregar):
+        return carregar()
+
+    def invalidar(self, *grupos):
+        pass
+
+    def estatisticas(self) -> list[dict]:
+        return []
+
+    def prometheus(self) -> str:
+        return ""
+
+
+@st.cache_resource
+def _cache_compartilhado() -> CacheCompartilhado | _SemCacheCompartilhado:
+    if not CACHE_COMPARTILHADO:
+        return _SemCacheCompartilhado()
+    return CacheCompartilhado(CACHE_COMPARTILHADO_DB, CACHE_ESPERA_SEG, CACHE_RETENCAO_SEG)
+
 
 # ==============================
 # UTIL
@@ -75,16 +1697,263 @@ def _normaliza_codigo(v) -> str:
         s = s[:-2]
     return s
 
-def listar_fotos_da_serie(numero_serie: str, tipo_producao: str | None = None):
+def em_paralelo(chamadas: dict) -> tuple[dict, dict]:
+    """
+    Roda as chamadas (nome → função sem argumentos) ao mesmo tempo e espera todas.
+    Retorna (resultados, erros) por nome: uma falha não interrompe as outras.
+    As threads herdam o contexto do Streamlit da tela que chamou (se houver).
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    resultados, erros = {}, {}
+
+    def rodar(nome, chamada):
+        try:
+            resultados[nome] = chamada()
+        except Exception as e:
+            erros[nome] = e
+
+    threads = [threading.Thread(target=rodar, args=item, name=f"paralelo-{item[0]}", daemon=True) for item in chamadas.items()]
+    for t in threads:
+        if ctx:
+            add_script_run_ctx(t, ctx)
+        t.start()
+    for t in threads:
+        t.join()
+    return resultados, erros
+
+# ==============================
+# CONSULTAS (janelas locais → UTC, paginação por chave)
+# ==============================
+def _local_para_utc(dia: datetime.date, hora: datetime.time) -> datetime.datetime:
+    # localize + normalize: cada limite pega o deslocamento do próprio instante (horário de verão antigo incluso)
+    return TZ.normalize(TZ.localize(datetime.datetime.combine(dia, hora))).astimezone(datetime.timezone.utc)
+
+def janela_utc(dia: datetime.date, inicio: datetime.time = datetime.time.min,
+               fim: datetime.time | None = None) -> tuple[str, str]:
+    """
+    Janela local do dia (ou de um turno) → [desde, ate) em ISO UTC, para comparar com data_hora.
+    Sem fim: até o mesmo horário do dia seguinte. Fim <= início (turno da noite): termina no dia seguinte.
+    """
+    fim = inicio if fim is None else fim
+    dia_fim = dia + datetime.timedelta(days=1) if fim <= inicio else dia
+    return _local_para_utc(dia, inicio).isoformat(), _local_para_utc(dia_fim, fim).isoformat()
+
+def _intervalo_utc(inicio: datetime.date, fim: datetime.date) -> tuple[str, str]:
+    """
+    Dias locais [inicio, fim] (fim incluso) → [desde, ate) em ISO UTC.
+    """
+    return janela_utc(inicio)[0], janela_utc(fim)[1]
+
+def _dia_local(data_hora_utc=None) -> str:
+    data_hora_utc = data_hora_utc or datetime.datetime.now(datetime.timezone.utc)
+    return data_hora_utc.astimezone(TZ).strftime("%Y-%m-%d")
+
+def _inicio_do_dia_utc() -> str:
+    return janela_utc(datetime.datetime.now(TZ).date())[0]
+
+def pagina_keyset(montar_consulta, cursor=None, n: int = 50, chave: str = "data_hora",
+                  desc: bool = False, desempate: str = "id") -> tuple[list[dict], tuple | None]:
+    """
+    Uma página ordenada por (chave, desempate), começando depois de `cursor`.
+    Sem OFFSET: o banco desce pelo índice direto até o cursor, então a página 100
+    custa o mesmo que a primeira, e linhas novas no meio não pulam nem repetem nada.
+    montar_consulta() devolve a consulta filtrada e sem ordem; a seleção precisa trazer
+    chave e desempate. Devolve (linhas, cursor da próxima página ou None no fim);
+    n não pode passar do max-rows do PostgREST (POSTGREST_MAX_ROWS).
+    """
+    q = montar_consulta()
+    if cursor is not None:
+        valor, ultimo = cursor
+        op = "lt" if desc else "gt"
+        if chave == desempate:
+            q = getattr(q, op)(chave, valor)
+        else:
+            q = q.or_(f'{chave}.{op}."{valor}",and({chave}.eq."{valor}",{desempate}.{op}."{ultimo}")')
+    q = q.order(chave, desc=desc)
+    if desempate != chave:
+        q = q.order(desempate, desc=desc)
+    linhas = q.limit(n).execute().data or []
+    proximo = (linhas[-1][chave], linhas[-1][desempate]) if len(linhas) == n else None
+    return linhas, proximo
+
+def paginas_keyset(montar_consulta, pagina: int = 1000, chave: str = "data_hora",
+                   desc: bool = False, desempate: str = "id"):
+    """
+    Gera as páginas de pagina_keyset até o fim. A página pedida é limitada ao
+    max-rows do servidor; aí página curta é o fim, sem ida extra por uma vazia.
+    """
+    pagina = min(pagina, POSTGREST_MAX_ROWS)
+    cursor = None
+    while True:
+        linhas, cursor = pagina_keyset(montar_consulta, cursor, pagina, chave, desc, desempate)
+        if linhas:
+            yield linhas
+        if cursor is None:
+            return
+
+def _selecionar_tudo(montar_consulta, pagina: int = 1000, chave: str = "data_hora") -> list[dict]:
+    """
+    Todas as linhas, em páginas por chave (o PostgREST corta em ~1000 por resposta).
+    """
+    return [linha for linhas in paginas_keyset(montar_consulta, pagina, chave) for linha in linhas]
+
+# ==============================
+# MANIFESTO DE FOTOS
+# ==============================
+class ManifestoFotos:
+    """
+    Fotos conhecidas por (série, tipo) e, dentro delas, por origem, como gravadas
+    em checklists_manga_pnm_fotos: storage_path, tamanho, sha256 e miniatura de cada uma.
+    A própria fila de envio registra cada foto nova; a tabela só é lida na
+    primeira vez que a série é aberta (ou depois de MANIFESTO_TTL_SEG).
+    O bucket nunca é listado para montar o painel.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}  # (serie, tipo) -> (expira, {origem: {storage_path: foto}})
+
+    def fotos(self, numero_serie: str, tipo_producao: str | None, carregar, origem: str | None = None) -> list[dict]:
+        """
+        Fotos da série (só as da `origem`, se dada), mais novas primeiro.
+        """
+        chave = (numero_serie, tipo_producao or None)
+        agora = time.monotonic()
+        with self._lock:
+            item = self._series.get(chave)
+        if item is None or item[0] <= agora:
+            linhas = carregar()
+            with self._lock:
+                atuais = self._series.get(chave, (0, {}))[1]
+                novas = {}
+                for f in linhas:
+                    novas.setdefault(f.get("origem") or "", {})[f["storage_path"]] = f
+                # registros que chegaram pela fila durante a leitura não se perdem
+                for o, por_caminho in atuais.items():
+                    novas.setdefault(o, {}).update(por_caminho)
+                self._series[chave] = (agora + MANIFESTO_TTL_SEG, novas)
+                item = self._series[chave]
+        with self._lock:
+            grupos = [item[1].get(origem or "", {})] if origem is not None else list(item[1].values())
+            lista = [f for grupo in grupos for f in grupo.values()]
+        # mesma ordem da paginação por chave: (data_hora, storage_path), mais novas primeiro
+        return sorted(lista, key=lambda f: (f.get("data_hora") or "", f["storage_path"]), reverse=True)
+
+    def registrar(self, foto: dict):
+        for tipo in {foto.get("tipo_producao") or None, None}:
+            chave = (foto["numero_serie"], tipo)
+            with self._lock:
+                # série ainda não aberta: nada a atualizar, a primeira leitura traz tudo
+                if chave in self._series:
+                    self._series[chave][1].setdefault(foto.get("origem") or "", {})[foto["storage_path"]] = foto
+
+
+@st.cache_resource
+def _manifesto_fotos() -> ManifestoFotos:
+    return ManifestoFotos()
+
+
+class UrlsAssinadas:
+    """
+    URLs assinadas por storage_path (bucket privado), num LRU do processo.
+    Cada URL é reaproveitada até faltar SIGNED_URL_RENOVAR_SEG para vencer;
+    as que faltam (ou estão para vencer) saem juntas num create_signed_urls
+    por lote, nunca uma chamada por foto.
+    """
+
+    def __init__(self, capacidade: int, validade_seg: int, renovar_seg: int):
+        self.capacidade = capacidade
+        self.validade_seg = validade_seg
+        self.renovar_seg = min(renovar_seg, validade_seg // 2)
+        self._lock = threading.Lock()
+        self._urls = collections.OrderedDict()  # storage_path -> (url, vence em monotonic)
+
+    def urls(self, cliente, caminhos) -> dict[str, str]:
+        agora = time.monotonic()
+        prontas, faltam = {}, []
+        with self._lock:
+            for caminho in dict.fromkeys(c for c in caminhos if c):
+                item = self._urls.get(caminho)
+                if item and item[1] - self.renovar_seg > agora:
+                    self._urls.move_to_end(caminho)
+                    prontas[caminho] = item[0]
+                else:
+                    faltam.append(caminho)
+        if not faltam:
+            return prontas
+
+        # validade contada de antes do pedido: nunca achamos que a URL vale mais do que vale
+        vence = agora + self.validade_seg
+        novas = {}
+        bucket = cliente.storage.from_(BUCKET_FOTOS)
+        for i in range(0, len(faltam), SIGNED_URL_LOTE):
+            for r in bucket.create_signed_urls(faltam[i:i + SIGNED_URL_LOTE], self.validade_seg):
+                url = r.get("signedURL") or r.get("signedUrl")
+                if url and not r.get("error"):
+                    novas[r["path"]] = url
+        with self._lock:
+            for caminho, url in novas.items():
+                self._urls[caminho] = (url, vence)
+                self._urls.move_to_end(caminho)
+            while len(self._urls) > self.capacidade:
+                self._urls.popitem(last=False)
+        prontas.update(novas)
+        return prontas
+
+
+@st.cache_resource
+def _urls_assinadas() -> UrlsAssinadas:
+    return UrlsAssinadas(SIGNED_URL_CACHE_MAX, SIGNED_URL_EXPIRA_SEG, SIGNED_URL_RENOVAR_SEG)
+
+
+def urls_das_fotos(cliente, fotos: list[dict]) -> list[dict]:
+    """
+    Bucket privado: troca url/thumb_url gravadas (já vencidas, em geral) por URLs
+    válidas do cache — uma chamada em lote para a página inteira, ou nenhuma.
+    Bucket público: devolve como está.
+    """
+    if not USAR_SIGNED_URL or not fotos:
+        return fotos
+    urls = _urls_assinadas().urls(cliente, [c for f in fotos for c in (f.get("storage_path"), f.get("thumb_path"))])
+    return [
+        {**f, "url": urls.get(f.get("storage_path"), ""), "thumb_url": urls.get(f.get("thumb_path")) if f.get("thumb_path") else None}
+        for f in fotos
+    ]
+
+FOTOS_PAGINA = 50
+
+def listar_fotos_da_serie(numero_serie: str, tipo_producao: str | None = None,
+                          n: int = FOTOS_PAGINA, cursor=None) -> tuple[pd.DataFrame, tuple | None]:
+    """
+    Fotos da série, mais novas primeiro, n por página. Devolve (df, cursor da próxima página).
+    A primeira página vem do manifesto; as seguintes, direto da tabela por (data_hora, storage_path).
+    """
     numero_serie = _normaliza_codigo(numero_serie)
-    q = supabase.table("checklists_manga_pnm_fotos").select("*").eq("numero_serie", numero_serie)
-    if tipo_producao:
-        q = q.eq("tipo_producao", tipo_producao)
-    data = q.order("data_hora", desc=True).limit(50).execute()
-    df = pd.DataFrame(data.data)
+
+    def consulta():
+        q = supabase.table("checklists_manga_pnm_fotos").select("*").eq("numero_serie", numero_serie)
+        return q.eq("tipo_producao", tipo_producao) if tipo_producao else q
+
+    def pagina(c):
+        return pagina_keyset(consulta, c, n, desc=True, desempate="storage_path")[0]
+
+    def primeira_pagina():
+        # a mesma série aberta em vários tablets: uma leitura da tabela para todos
+        return _cache_compartilhado().obter(
+            f"fotos:{numero_serie}:{tipo_producao or ''}:{n}", (f"fotos:{numero_serie}",),
+            MANIFESTO_TTL_SEG, lambda: pagina(None),
+        )
+
+    if cursor is None:
+        fotos = _manifesto_fotos().fotos(numero_serie, tipo_producao, primeira_pagina)[:n]
+    else:
+        fotos = pagina(cursor)
+    proximo = (fotos[-1]["data_hora"], fotos[-1]["storage_path"]) if len(fotos) == n else None
+
+    df = pd.DataFrame(urls_das_fotos(supabase, fotos))
     if not df.empty and "data_hora" in df.columns:
-        df["data_hora"] = pd.to_datetime(df["data_hora"], utc=True).dt.tz_convert(TZ)
-    return df
+        df["data_hora"] = pd.to_datetime(df["data_hora"], utc=True, format="ISO8601").dt.tz_convert(TZ)
+    return df, proximo
 
 def listar_arquivos_no_storage(prefixo: str):
     """
@@ -99,109 +1968,568 @@ def listar_arquivos_no_storage(prefixo: str):
 
 def gerar_url(storage_path: str):
     """
-    Bucket PUBLIC → usa public_url direto
+    Bucket PUBLIC → usa public_url direto; privado → URL assinada do cache
     """
     try:
+        if USAR_SIGNED_URL:
+            return _urls_assinadas().urls(supabase, [storage_path]).get(storage_path)
         return supabase.storage.from_(BUCKET_FOTOS).get_public_url(storage_path)
     except Exception as e:
         st.error(f"❌ Erro ao gerar URL para {storage_path}: {e}")
         return None
 
-def upload_foto_para_supabase_storage(numero_serie, tipo_producao, op, usuario, arquivo, origem):
-    if arquivo is None:
-        st.error("❌ Nenhum arquivo recebido pelo uploader.")
-        return None, None, None
+def _tem_pillow() -> bool:
+    return importlib.util.find_spec("PIL") is not None
+
+def _mime_saida_foto(content_type: str) -> str:
+    """
+    Tipo do arquivo que vai para o Storage depois do processar_imagem.
+    """
+    if FOTO_PROCESSAR and _tem_pillow():
+        return "image/webp" if FOTO_FORMATO.upper() == "WEBP" else "image/jpeg"
+    return content_type
+
+def _mime_dos_bytes(conteudo: bytes, padrao: str) -> str:
+    """
+    Tipo pelo cabeçalho do arquivo (o que vai subir de fato); desconhecido → padrao.
+    """
+    if conteudo[:4] == b"RIFF" and conteudo[8:12] == b"WEBP":
+        return "image/webp"
+    if conteudo[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if conteudo[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    return padrao
+
+def _caminho_miniatura(storage_path: str) -> str:
+    # mesma pasta tipo/serie/ do original
+    base, _, _ = storage_path.rpartition(".")
+    return f"{base}__thumb.{_ext_from_mime(_mime_saida_foto('image/jpeg'))}"
+
+def _codificar_imagem(img, qualidade: int) -> bytes:
+    out = io.BytesIO()
+    if FOTO_FORMATO.upper() == "WEBP":
+        img.save(out, format="WEBP", quality=qualidade, method=4)
+    else:
+        img.save(out, format="JPEG", quality=qualidade, optimize=True, progressive=True)
+    return out.getvalue()
+
+def processar_imagem(file_bytes: bytes) -> tuple[bytes, bytes | None]:
+    """
+    Limita a resolução, recomprime e descarta EXIF (a rotação é aplicada antes).
+    Retorna (foto, miniatura). Sem Pillow ou imagem ilegível → (original, None).
+    """
+    if not FOTO_PROCESSAR or not _tem_pillow():
+        return file_bytes, None
+
+    # import aqui: só a thread da fila de fotos paga por ele, nunca o rerun da página
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(file_bytes)) as original:
+            img = ImageOps.exif_transpose(original).convert("RGB")
+    except Exception as e:
+        log.warning("fotos: não consegui abrir a imagem, enviando o original: %s", e)
+        return file_bytes, None
 
-    file_bytes = arquivo.getvalue()
-    if not file_bytes:
-        st.error("❌ Arquivo veio vazio (0 bytes).")
-        return None, None, None
+    img.thumbnail((FOTO_LADO_MAX, FOTO_LADO_MAX), Image.LANCZOS)
+    foto = _codificar_imagem(img, FOTO_QUALIDADE)
 
-    numero_serie = _normaliza_codigo(numero_serie)
-    op = _normaliza_codigo(op)
-    tipo_producao = _normaliza_codigo(tipo_producao)
-    usuario = _normaliza_codigo(usuario) or "Operador_Logado"
+    img.thumbnail((MINIATURA_LADO, MINIATURA_LADO), Image.LANCZOS)
+    miniatura = _codificar_imagem(img, MINIATURA_QUALIDADE)
+    return foto, miniatura
 
-    ext = _ext_from_mime(getattr(arquivo, "type", "image/jpeg"))
-    ts = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+def _caminho_foto(numero_serie, tipo_producao, op, usuario, origem, ext, hash_conteudo):
+    # nome pelo conteúdo (não pela hora): a mesma foto cai sempre no mesmo arquivo
+    marca = hash_conteudo[:16]
 
     safe_tipo = _sanitize(tipo_producao or "NA")
     safe_serie = _sanitize(numero_serie or "NA")
     safe_op = _sanitize(op or "NA")
     safe_user = _sanitize(usuario or "NA")
 
-    nome_arquivo = f"{safe_serie}__OP{safe_op}__{safe_user}__{origem}__{ts}.{ext}"
+    nome_arquivo = f"{safe_serie}__OP{safe_op}__{safe_user}__{origem}__{marca}.{ext}"
     storage_path = f"{safe_tipo}/{safe_serie}/{nome_arquivo}"
+    return storage_path, nome_arquivo
 
-    # 1) Upload no Storage (com retorno)
-    try:
-        resp = supabase.storage.from_(BUCKET_FOTOS).upload(
-            path=storage_path,
-            file=file_bytes,
+class _TusHttp:
+    """
+    Upload retomável do Supabase Storage (protocolo TUS em /storage/v1/upload/resumable):
+    criar → endereço do upload; posicao → quanto o servidor já confirmou; enviar → um pedaço.
+    """
+
+    def __init__(self, url: str, key: str, timeout: float):
+        self.endpoint = f"{url.rstrip('/')}/storage/v1/upload/resumable"
+        self._http = httpx.Client(timeout=timeout, headers={
+            "authorization": f"Bearer {key}",
+            "apikey": key,
+            "tus-resumable": "1.0.0",
+        })
+
+    def criar(self, bucket: str, caminho: str, tamanho: int, content_type: str) -> str:
+        metadados = {"bucketName": bucket, "objectName": caminho, "contentType": content_type, "cacheControl": "3600"}
+        r = self._http.post(self.endpoint, headers={
+            "upload-length": str(tamanho),
+            "upload-metadata": ",".join(f"{k} {base64.b64encode(v.encode()).decode()}" for k, v in metadados.items()),
+            "x-upsert": "true",
+        })
+        r.raise_for_status()
+        return str(httpx.URL(self.endpoint).join(r.headers["location"]))
+
+    def posicao(self, url: str) -> int | None:
+        r = self._http.head(url)
+        if r.status_code in (404, 410):
+            return None  # upload expirou (24 h no Supabase): recomeça
+        r.raise_for_status()
+        return int(r.headers["upload-offset"])
+
+    def enviar(self, url: str, posicao: int, pedaco: bytes) -> int:
+        r = self._http.patch(url, content=pedaco, headers={
+            "upload-offset": str(posicao),
+            "content-type": "application/offset+octet-stream",
+        })
+        r.raise_for_status()
+        return int(r.headers["upload-offset"])
+
+
+@st.cache_resource
+def _tus():
+    if BACKEND == "local":
+        return supabase.interno.interno.tus  # Instrumentado → Resiliente → ClienteLocal
+    return _TusHttp(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"), STORAGE_TIMEOUT_SEG)
+
+
+def enviar_retomavel(cliente, tarefa: dict, caminho: str, conteudo: bytes, salvar_progresso=None):
+    """
+    Upload em pedaços de UPLOAD_PEDACO_BYTES. O endereço do upload fica na tarefa
+    (e no banco da fila, via salvar_progresso): a próxima tentativa pergunta ao
+    servidor até onde chegou e continua dali, sem mandar o arquivo inteiro de novo.
+    """
+    tus = _tus()
+    salvar_progresso = salvar_progresso or (lambda **campos: None)
+
+    def chamar(operacao, funcao):
+        # mesmo prazo/disjuntor e mesmas métricas das outras chamadas de Storage
+        with cliente.metricas.medir(f"storage.{operacao}", BUCKET_FOTOS):
+            return cliente.executar("storage", operacao, funcao)
+
+    url = tarefa.get("upload_url")
+    posicao = chamar("upload_posicao", lambda: tus.posicao(url)) if url else None
+    if posicao is None:
+        url = chamar("upload_criar", lambda: tus.criar(BUCKET_FOTOS, caminho, len(conteudo), tarefa["content_type"]))
+        posicao = 0
+        tarefa["upload_url"] = url
+        salvar_progresso(upload_url=url)
+
+    while posicao < len(conteudo):
+        pedaco = conteudo[posicao:posicao + UPLOAD_PEDACO_BYTES]
+        posicao = chamar("upload_pedaco", lambda: tus.enviar(url, posicao, pedaco))
+
+    tarefa["upload_url"] = None
+    salvar_progresso(upload_url=None)
+
+def enviar_foto_para_supabase_storage(cliente, tarefa: dict, file_bytes: bytes, miniatura: bytes | None = None,
+                                      salvar_progresso=None) -> str:
+    """
+    Upload no Storage (foto + miniatura) + registro em checklists_manga_pnm_fotos.
+    Roda nas threads da FilaFotos (sem st.*): erro vira exceção.
+    Retorna o registro gravado na tabela (ou o que já existia, se a mesma
+    foto já foi registrada nesta série).
+    """
+    storage_path = tarefa["storage_path"]
+    thumb_path = tarefa.get("thumb_path") if miniatura is not None else None
+    sha256 = hashlib.sha256(file_bytes).hexdigest()
+
+    # 0) Mesma foto já registrada na série (toque duplo, nova tentativa depois de
+    #    timeout no insert): não sobe nem grava de novo
+    ja_registrada = cliente.table("checklists_manga_pnm_fotos").select("*") \
+        .eq("numero_serie", tarefa["numero_serie"]).eq("sha256", sha256).limit(1).execute().data
+    if ja_registrada:
+        tarefa["etapa"] = "repetida"
+        return ja_registrada[0]
+
+    def subir(caminho, conteudo):
+        if len(conteudo) > UPLOAD_PEDACO_BYTES:
+            return enviar_retomavel(cliente, tarefa, caminho, conteudo, salvar_progresso)
+        resp = cliente.storage.from_(BUCKET_FOTOS).upload(
+            path=caminho,
+            file=conteudo,
             file_options={
-                "content-type": getattr(arquivo, "type", "image/jpeg"),
+                "content-type": tarefa["content_type"],
                 "upsert": True,  # <-- boolean
             },
         )
-    except Exception as e:
-        st.error(f"❌ EXCEÇÃO no upload do Storage:\n{e}")
-        return None, None, None
-
-    # Algumas versões retornam dict/obj com erro, sem exception:
-    if isinstance(resp, dict) and resp.get("error"):
-        st.error(f"❌ ERRO do Storage (resp.error): {resp['error']}")
-        st.code(str(resp))
-        return None, None, None
+        # Algumas versões retornam dict/obj com erro, sem exception:
+        if isinstance(resp, dict) and resp.get("error"):
+            raise RuntimeError(f"ERRO do Storage (resp.error): {resp['error']}")
 
-    # 2) Confirma se o arquivo apareceu na pasta (debug)
-    prefixo = f"{safe_tipo}/{safe_serie}"
-    try:
-        arquivos = supabase.storage.from_(BUCKET_FOTOS).list(path=prefixo) or []
-        nomes = [a.get("name") for a in arquivos if isinstance(a, dict)]
-        if nome_arquivo not in nomes:
-            st.warning("⚠️ Upload executou, mas não encontrei o arquivo na listagem do Storage.")
-            st.write("Prefixo:", prefixo)
-            st.write("Listagem:", nomes)
-    except Exception as e:
-        st.warning(f"⚠️ Não consegui listar Storage para confirmar (isso já indica policy): {e}")
+    # 1) Upload no Storage: foto e miniatura ao mesmo tempo. O que já subiu numa
+    #    tentativa anterior (etapa foto_ok / storage_ok) não sobe de novo.
+    if tarefa.get("etapa") != "storage_ok":
+        uploads = {}
+        if tarefa.get("etapa") != "foto_ok":
+            uploads["foto"] = lambda: subir(storage_path, file_bytes)
+        if thumb_path:
+            uploads["miniatura"] = lambda: subir(thumb_path, miniatura)
+        _, erros = em_paralelo(uploads)
+        if "foto" in uploads and "foto" not in erros:
+            tarefa["etapa"] = "foto_ok"
+        if erros:
+            raise RuntimeError("; ".join(f"{nome}: {erro}" for nome, erro in erros.items()))
+        tarefa["etapa"] = "storage_ok"
 
-    # 3) URL
-    url = None
+    # 2) URL (privado: foto + miniatura numa chamada só, e já ficam no cache para a galeria)
     if USAR_SIGNED_URL:
-        try:
-            signed = supabase.storage.from_(BUCKET_FOTOS).create_signed_url(storage_path, SIGNED_URL_EXPIRA_SEG)
-            url = signed.get("signedURL") or signed.get("signedUrl") or signed.get("signed_url")
-        except Exception as e:
-            st.warning(f"⚠️ Não consegui gerar signed URL: {e}")
+        urls = _urls_assinadas().urls(cliente, [storage_path, thumb_path])
+        url, thumb_url = urls.get(storage_path), urls.get(thumb_path) if thumb_path else None
     else:
-        try:
-            url = supabase.storage.from_(BUCKET_FOTOS).get_public_url(storage_path)
-        except Exception as e:
-            st.warning(f"⚠️ Não consegui gerar public URL: {e}")
+        url = cliente.storage.from_(BUCKET_FOTOS).get_public_url(storage_path)
+        thumb_url = cliente.storage.from_(BUCKET_FOTOS).get_public_url(thumb_path) if thumb_path else None
 
-    # 4) Inserir registro na tabela de fotos (com checagem)
-    try:
-        ins = supabase.table("checklists_manga_pnm_fotos").insert({
+    # 3) Inserir registro na tabela de fotos
+    registro = {
+        "numero_serie": tarefa["numero_serie"],
+        "tipo_producao": tarefa["tipo_producao"],
+        "op": tarefa["op"],
+        "usuario": tarefa["usuario"],
+        "url": url or "",
+        "origem": tarefa["origem"],
+        "data_hora": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "storage_path": storage_path,
+        "nome_arquivo": tarefa["nome_arquivo"],
+        "thumb_path": thumb_path,
+        "thumb_url": thumb_url,
+        "tamanho": len(file_bytes),
+        "sha256": sha256,
+    }
+    ins = cliente.table("checklists_manga_pnm_fotos").insert(registro).execute()
+
+    if getattr(ins, "error", None):
+        raise RuntimeError(f"ERRO ao inserir na tabela checklists_manga_pnm_fotos: {ins.error}")
+
+    return registro
+
+
+# ==============================
+# FILA DE FOTOS (envio em segundo plano)
+# ==============================
+class FilaFotos:
+    """
+    Fila persistente (SQLite + arquivos em disco) com um pool fixo de threads.
+    O checklist só enfileira e segue; cada mudança de status dispara os
+    callbacks registrados em ao_mudar(). Falha de rede → nova tentativa com
+    backoff; após FOTOS_MAX_TENTATIVAS fica em 'falha' até reenviar().
+    """
+
+    def __init__(self, caminho_db: Path, pasta: Path, cliente, workers: int = FOTOS_WORKERS):
+        self.cliente = cliente
+        self.pasta = pasta
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._acordar = threading.Event()
+        self._conn = _conectar_sqlite(caminho_db)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS fotos_fila (
+                id TEXT PRIMARY KEY,
+                numero_serie TEXT NOT NULL,
+                tipo_producao TEXT,
+                op TEXT,
+                usuario TEXT,
+                origem TEXT,
+                content_type TEXT,
+                storage_path TEXT NOT NULL,
+                nome_arquivo TEXT NOT NULL,
+                arquivo_local TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pendente',
+                etapa TEXT,
+                thumb_path TEXT,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                proxima_tentativa REAL NOT NULL DEFAULT 0,
+                ultimo_erro TEXT,
+                url TEXT,
+                criado_em TEXT NOT NULL,
+                atualizado_em TEXT NOT NULL
+            )
+        """)
+        _garantir_coluna(self._conn, "fotos_fila", "thumb_path", "TEXT")
+        _garantir_coluna(self._conn, "fotos_fila", "hash_original", "TEXT")
+        _garantir_coluna(self._conn, "fotos_fila", "upload_url", "TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_fotos_fila_status ON fotos_fila (status, proxima_tentativa)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_fotos_fila_serie ON fotos_fila (numero_serie)")
+        # processo caiu no meio de um envio → volta para a fila
+        self._conn.execute("UPDATE fotos_fila SET status = 'pendente' WHERE status = 'enviando'")
+        self._proxima_limpeza = 0.0
+        self.limpar_antigos()
+
+        for n in range(workers):
+            threading.Thread(target=self._worker, name=f"fila-fotos-{n}", daemon=True).start()
+
+    def ao_mudar(self, callback):
+        """
+        callback(tarefa: dict) — chamado da thread do worker a cada mudança de status.
+        """
+        self._callbacks.append(callback)
+
+    def enfileirar(self, numero_serie, tipo_producao, op, usuario, origem, content_type, file_bytes) -> dict:
+        """
+        Mesma foto (mesmo conteúdo) já na fila desta série → devolve a tarefa que
+        já existe (e, se tinha falhado, manda de novo) em vez de criar outra.
+        """
+        hash_original = hashlib.sha256(file_bytes).hexdigest()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM fotos_fila WHERE numero_serie = ? AND hash_original = ? ORDER BY criado_em DESC LIMIT 1",
+                (numero_serie, hash_original),
+            ).fetchone()
+        if row is not None:
+            if row["status"] == "falha":
+                self.reenviar(row["id"])
+            return {**dict(row), "repetida": True}
+
+        # extensão prevista para depois do processamento; _preparar acerta
+        # tipo e extensão pelo arquivo que sair de lá
+        storage_path, nome_arquivo = _caminho_foto(
+            numero_serie, tipo_producao, op, usuario, origem, _ext_from_mime(_mime_saida_foto(content_type)), hash_original
+        )
+        id_tarefa = uuid.uuid4().hex
+        arquivo_local = self.pasta / f"{id_tarefa}.bin"
+        arquivo_local.write_bytes(file_bytes)
+
+        agora = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        tarefa = {
+            "id": id_tarefa,
             "numero_serie": numero_serie,
             "tipo_producao": tipo_producao,
             "op": op,
             "usuario": usuario,
-            "url": url or "",
             "origem": origem,
-            "data_hora": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "content_type": content_type,
             "storage_path": storage_path,
-            "nome_arquivo": nome_arquivo
-        }).execute()
+            "nome_arquivo": nome_arquivo,
+            "arquivo_local": str(arquivo_local),
+            "hash_original": hash_original,
+            "criado_em": agora,
+            "atualizado_em": agora,
+        }
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO fotos_fila (id, numero_serie, tipo_producao, op, usuario, origem, content_type, "
+                "storage_path, nome_arquivo, arquivo_local, hash_original, criado_em, atualizado_em) VALUES (:id, "
+                ":numero_serie, :tipo_producao, :op, :usuario, :origem, :content_type, :storage_path, :nome_arquivo, "
+                ":arquivo_local, :hash_original, :criado_em, :atualizado_em)",
+                tarefa,
+            )
+        tarefa["status"] = "pendente"
+        self._notificar(tarefa)
+        self._acordar.set()
+        return tarefa
 
-        if getattr(ins, "error", None):
-            st.error(f"❌ ERRO ao inserir na tabela checklists_manga_pnm_fotos: {ins.error}")
-            return url, storage_path, nome_arquivo
+    def reenviar(self, id_tarefa: str):
+        self._atualizar(id_tarefa, status="pendente", tentativas=0, proxima_tentativa=0)
+        self._acordar.set()
 
-    except Exception as e:
-        st.error(f"❌ EXCEÇÃO ao inserir registro da foto: {e}")
-        return url, storage_path, nome_arquivo
+    def status_da_serie(self, numero_serie: str) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, origem, nome_arquivo, status, tentativas, ultimo_erro, url, atualizado_em "
+                "FROM fotos_fila WHERE numero_serie = ? ORDER BY criado_em DESC",
+                (numero_serie,),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def em_andamento(self) -> list[dict]:
+        """
+        Tudo que ainda não foi concluído (pendente, enviando ou falha), de todas as séries.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, numero_serie, origem, status, tentativas, ultimo_erro, atualizado_em "
+                "FROM fotos_fila WHERE status != 'enviado' ORDER BY criado_em"
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def limpar_antigos(self, dias: int = FOTOS_RETENCAO_DIAS):
+        """
+        Apaga as tarefas enviadas há mais de `dias` e os arquivos da pasta que
+        nenhuma tarefa usa mais. Roda ao abrir a fila e depois uma vez por dia.
+        """
+        limite = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=dias)).isoformat()
+        with self._lock:
+            self._proxima_limpeza = time.monotonic() + 24 * 3600
+            self._conn.execute("DELETE FROM fotos_fila WHERE status = 'enviado' AND atualizado_em < ?", (limite,))
+            em_uso = {Path(r["arquivo_local"]).name for r in self._conn.execute("SELECT arquivo_local FROM fotos_fila")}
+        # arquivo recente pode ser de uma tarefa sendo enfileirada agora (por outro processo)
+        recente = time.time() - 3600
+        for arquivo in self.pasta.iterdir():
+            if arquivo.name.removesuffix(".thumb") not in em_uso and arquivo.stat().st_mtime < recente:
+                arquivo.unlink(missing_ok=True)
+
+    def _pegar_proxima(self) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM fotos_fila WHERE status = 'pendente' AND proxima_tentativa <= ? "
+                "ORDER BY criado_em LIMIT 1",
+                (time.time(),),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE fotos_fila SET status = 'enviando' WHERE id = ?", (row["id"],))
+        tarefa = dict(row)
+        tarefa["status"] = "enviando"
+        return tarefa
+
+    def _atualizar(self, id_tarefa: str, **campos):
+        campos["atualizado_em"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        sets = ", ".join(f"{k} = :{k}" for k in campos)
+        with self._lock:
+            self._conn.execute(f"UPDATE fotos_fila SET {sets} WHERE id = :id", {**campos, "id": id_tarefa})
+
+    def _notificar(self, tarefa: dict):
+        for callback in list(self._callbacks):
+            try:
+                callback(dict(tarefa))
+            except Exception:
+                log.exception("fila de fotos: callback falhou")
 
-    return url, storage_path, nome_arquivo
+    def _worker(self):
+        while True:
+            tarefa = self._pegar_proxima()
+            if tarefa is None:
+                if time.monotonic() >= self._proxima_limpeza:
+                    self.limpar_antigos()
+                self._acordar.wait(2)
+                self._acordar.clear()
+                continue
+
+            self._notificar(tarefa)
+            try:
+                file_bytes, miniatura = self._preparar(tarefa)
+                tarefa["registro"] = enviar_foto_para_supabase_storage(
+                    self.cliente, tarefa, file_bytes, miniatura,
+                    salvar_progresso=lambda **campos: self._atualizar(tarefa["id"], **campos),
+                )
+                tarefa["url"] = tarefa["registro"]["url"]
+            except Exception as e:
+                tarefa["tentativas"] += 1
+                tarefa["ultimo_erro"] = str(e)
+                if tarefa["tentativas"] >= FOTOS_MAX_TENTATIVAS:
+                    tarefa["status"] = "falha"
+                else:
+                    tarefa["status"] = "pendente"
+                self._atualizar(
+                    tarefa["id"],
+                    status=tarefa["status"],
+                    etapa=tarefa.get("etapa"),
+                    tentativas=tarefa["tentativas"],
+                    ultimo_erro=tarefa["ultimo_erro"],
+                    proxima_tentativa=time.time() + min(FLUSH_BACKOFF_MAX_SEG, 2 ** tarefa["tentativas"]),
+                )
+                self._notificar(tarefa)
+                continue
+
+            tarefa["status"] = "enviado"
+            tarefa["ultimo_erro"] = None
+            self._atualizar(tarefa["id"], status="enviado", etapa=tarefa.get("etapa"), url=tarefa["url"], ultimo_erro=None)
+            Path(tarefa["arquivo_local"]).unlink(missing_ok=True)
+            Path(f"{tarefa['arquivo_local']}.thumb").unlink(missing_ok=True)
+            self._notificar(tarefa)
+
+    def _preparar(self, tarefa: dict) -> tuple[bytes, bytes | None]:
+        """
+        Processa a foto uma única vez (resultado fica no disco para as retentativas).
+        """
+        arquivo = Path(tarefa["arquivo_local"])
+        arquivo_thumb = Path(f"{arquivo}.thumb")
+        if tarefa.get("etapa") is None:
+            foto, miniatura = processar_imagem(arquivo.read_bytes())
+            arquivo.write_bytes(foto)
+            # processamento falhou → sobe o original, com o tipo e a extensão dele
+            tarefa["content_type"] = _mime_dos_bytes(foto, tarefa["content_type"])
+            base, _, _ = tarefa["storage_path"].rpartition(".")
+            tarefa["storage_path"] = f"{base}.{_ext_from_mime(tarefa['content_type'])}"
+            tarefa["nome_arquivo"] = tarefa["storage_path"].rpartition("/")[2]
+            if miniatura is not None:
+                arquivo_thumb.write_bytes(miniatura)
+                tarefa["thumb_path"] = _caminho_miniatura(tarefa["storage_path"])
+            tarefa["etapa"] = "processada"
+            self._atualizar(
+                tarefa["id"], etapa="processada", thumb_path=tarefa.get("thumb_path"),
+                content_type=tarefa["content_type"], storage_path=tarefa["storage_path"],
+                nome_arquivo=tarefa["nome_arquivo"],
+            )
+            return foto, miniatura
+
+        miniatura = arquivo_thumb.read_bytes() if arquivo_thumb.exists() else None
+        return arquivo.read_bytes(), miniatura
+
+
+@st.cache_resource
+def _fila_fotos() -> FilaFotos:
+    fila = FilaFotos(FILA_FOTOS_DB, FILA_FOTOS_PASTA, supabase)
+    manifesto = _manifesto_fotos()
+    cache = _cache_compartilhado()
+
+    def _ao_enviar(tarefa):
+        if tarefa["status"] == "enviado":
+            manifesto.registrar(tarefa["registro"])
+            cache.invalidar(f"fotos:{tarefa['registro']['numero_serie']}")
+
+    fila.ao_mudar(_ao_enviar)
+    return fila
+
+def enfileirar_foto(numero_serie, tipo_producao, op, usuario, arquivo, origem):
+    """
+    Valida o arquivo do uploader e entrega para a FilaFotos. Não espera o envio.
+    Falha levanta exceção: quem chama monta a mensagem (roda fora da thread da tela).
+    """
+    if arquivo is None:
+        raise ValueError("nenhum arquivo recebido pelo uploader")
+
+    file_bytes = arquivo.getvalue()
+    if not file_bytes:
+        raise ValueError("arquivo veio vazio (0 bytes)")
+
+    return _fila_fotos().enfileirar(
+        numero_serie=_normaliza_codigo(numero_serie),
+        tipo_producao=_normaliza_codigo(tipo_producao),
+        op=_normaliza_codigo(op),
+        usuario=_normaliza_codigo(usuario) or "Operador_Logado",
+        origem=origem,
+        content_type=getattr(arquivo, "type", None) or "image/jpeg",
+        file_bytes=file_bytes,
+    )
+
+STATUS_ENVIO_FOTO = {
+    "pendente": "⏳ Na fila",
+    "enviando": "📤 Enviando",
+    "enviado": "✅ Enviada",
+    "falha": "❌ Falhou",
+}
+
+@st.fragment(run_every=FOTOS_PAINEL_SEG)
+def painel_envio_fotos(numero_serie: str | None = None):
+    """
+    Status do envio de fotos: de uma série, ou (sem série) tudo que ainda não terminou.
+    Só este trecho roda de novo a cada FOTOS_PAINEL_SEG, acompanhando a fila.
+    """
+    fila = _fila_fotos()
+    tarefas = fila.status_da_serie(numero_serie) if numero_serie else fila.em_andamento()
+    if not tarefas:
+        return
+
+    st.markdown("#### 📤 Envio de fotos")
+    for t in tarefas:
+        linha = f"{STATUS_ENVIO_FOTO.get(t['status'], t['status'])} — {t.get('numero_serie', numero_serie)} / {t['origem']}"
+        if t["tentativas"]:
+            linha += f" (tentativa {t['tentativas']})"
+        cols = st.columns([8, 2])
+        cols[0].markdown(linha)
+        if t["ultimo_erro"] and t["status"] != "enviado":
+            cols[0].caption(t["ultimo_erro"])
+        if t["status"] == "falha" and cols[1].button("🔁 Reenviar", key=f"reenviar_{t['id']}"):
+            fila.reenviar(t["id"])
+            st.rerun(scope="fragment")
 
 
 # ==============================
@@ -213,50 +2541,285 @@ def salvar_apontamento(numero_serie, op, tipo_producao, usuario):
     tipo_producao = _normaliza_codigo(tipo_producao)
     usuario = _normaliza_codigo(usuario) or "Operador_Logado"
 
-    check = supabase.table("apontamentos_manga_pnm") \
-        .select("id") \
-        .eq("numero_serie", numero_serie) \
-        .execute()
-
-    if check.data:
+    # releitura óbvia: recusa sem ir ao servidor
+    indice = _indice_series()
+    if indice.conferir([numero_serie]):
         return False, f"Série {numero_serie} já apontada."
 
+    # grava no journal local e confirma na hora; o flusher envia ao Supabase
+    data_hora = datetime.datetime.now(datetime.timezone.utc).isoformat()
     try:
-        supabase.table("apontamentos_manga_pnm").insert({
+        gravado = _journal().registrar({
+            "chave": uuid.uuid4().hex,
             "numero_serie": numero_serie,
             "op": op,
             "tipo_producao": tipo_producao,
             "usuario": usuario,
-            "data_hora": datetime.datetime.now(datetime.timezone.utc).isoformat()
-        }).execute()
+            "data_hora": data_hora
+        })
+    except Exception as e:
+        return False, str(e)
+
+    if not gravado:
+        return False, f"Série {numero_serie} já apontada."
+
+    indice.adicionar(numero_serie)
+    _indice_pendentes().adicionar({
+        "numero_serie": numero_serie, "op": op, "tipo_producao": tipo_producao, "data_hora": data_hora
+    })
+    _flusher()  # garante a thread de envio viva neste processo
+    return True, None
 
-        st.cache_data.clear()
-        return True, None
+def salvar_apontamentos_lote(pares: list[dict], tipo_producao, usuario) -> list[dict]:
+    """
+    Modo lote: grava todos os pares no journal numa transação; o flusher manda
+    o lote num upsert só. Uma linha por par, com resultado gravada / duplicada / erro.
+    """
+    tipo_producao = _normaliza_codigo(tipo_producao)
+    usuario = _normaliza_codigo(usuario) or "Operador_Logado"
+    indice = _indice_series()
+    ja_apontadas = indice.conferir([_normaliza_codigo(par["numero_serie"]) for par in pares])
 
+    resultado, registros = [], []
+    for par in pares:
+        numero_serie = _normaliza_codigo(par["numero_serie"])
+        linha = {"numero_serie": numero_serie, "op": _normaliza_codigo(par["op"]), "resultado": "gravada", "detalhe": None}
+        if numero_serie in ja_apontadas:
+            linha.update(resultado="duplicada", detalhe="já apontada")
+        else:
+            registros.append({
+                "chave": uuid.uuid4().hex,
+                "numero_serie": numero_serie,
+                "op": linha["op"],
+                "tipo_producao": tipo_producao,
+                "usuario": usuario,
+                "data_hora": par["data_hora"],
+            })
+        resultado.append(linha)
+
+    try:
+        gravadas = _journal().registrar_lote(registros)
     except Exception as e:
-        return False, str(e)
+        for linha in resultado:
+            if linha["resultado"] == "gravada":
+                linha.update(resultado="erro", detalhe=str(e))
+        return resultado
 
-def carregar_apontamentos():
-    data = supabase.table("apontamentos_manga_pnm") \
-        .select("*") \
-        .order("data_hora", desc=True) \
-        .limit(20) \
-        .execute()
+    for linha in resultado:
+        if linha["resultado"] == "gravada" and linha["numero_serie"] not in gravadas:
+            linha.update(resultado="duplicada", detalhe="já apontada")
+
+    indice.adicionar(*gravadas)
+    pendentes = _indice_pendentes()
+    for r in registros:
+        if r["numero_serie"] in gravadas:
+            pendentes.adicionar({k: r[k] for k in ("numero_serie", "op", "tipo_producao", "data_hora")})
+    _flusher()
+    return resultado
+
+def listar_apontamentos(n: int = 20, cursor=None, desde_utc: str | None = None, ate_utc: str | None = None,
+                        tipo_producao: str | None = None) -> tuple[pd.DataFrame, tuple | None]:
+    """
+    Apontamentos do servidor, mais novos primeiro, n por página (paginação por (data_hora, id)).
+    Devolve (df, cursor da próxima página ou None no fim).
+    """
+    def consulta():
+        q = supabase.table("apontamentos_manga_pnm").select("id, numero_serie, op, tipo_producao, usuario, data_hora")
+        if desde_utc:
+            q = q.gte("data_hora", desde_utc)
+        if ate_utc:
+            q = q.lt("data_hora", ate_utc)
+        if tipo_producao:
+            q = q.eq("tipo_producao", tipo_producao)
+        return q
+
+    linhas, proximo = pagina_keyset(consulta, cursor, n, desc=True)
+    df = pd.DataFrame(linhas)
+    if not df.empty:
+        df["data_hora"] = pd.to_datetime(df["data_hora"], utc=True, format="ISO8601").dt.tz_convert(TZ)
+    return df, proximo
+
+def carregar_apontamentos(n: int = 20):
+    feed = _feed_apontamentos()
+    try:
+        with supabase.prazo(PRAZO_TELA_SEG):
+            feed.atualizar(supabase)
+    except BackendIndisponivel:
+        # offline: o aviso já está no topo da página; lento: avisa aqui. Segue com o buffer
+        if not supabase.offline:
+            st.caption("🐢 Servidor lento — mostrando os últimos apontamentos conhecidos.")
+    except Exception as e:
+        st.warning(f"⚠️ Não consegui atualizar os apontamentos (mostrando os últimos conhecidos): {e}")
 
-    df = pd.DataFrame(data.data)
+    df = pd.DataFrame(feed.recentes(n))
     if not df.empty and "data_hora" in df.columns:
-        df["data_hora"] = pd.to_datetime(df["data_hora"], utc=True).dt.tz_convert(TZ)
+        df["data_hora"] = pd.to_datetime(df["data_hora"], utc=True, format="ISO8601").dt.tz_convert(TZ)
+
+    # leituras ainda no journal (não enviadas) também aparecem
+    locais = pd.DataFrame(_journal().nao_enviados())
+    if not locais.empty:
+        locais["data_hora"] = pd.to_datetime(locais["data_hora"], utc=True).dt.tz_convert(TZ)
+        if not df.empty:
+            locais = locais[~locais["numero_serie"].isin(df["numero_serie"].map(_normaliza_codigo))]
+        df = pd.concat([locais, df], ignore_index=True) \
+            .sort_values("data_hora", ascending=False) \
+            .head(n) \
+            .reset_index(drop=True)
     return df
 
+
+# ==============================
+# PENDÊNCIAS DE CHECKLIST (índice incremental)
+# ==============================
+class IndicePendentes:
+    """
+    Séries apontadas hoje que ainda não têm checklist, por (numero_serie, tipo_producao).
+    Carrega o dia uma vez e depois só busca o que entrou depois das marcas
+    (id dos apontamentos, data_hora dos checklists). Gravações deste processo
+    entram/saem na hora por adicionar()/remover().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._reiniciar(None)
+
+    def _reiniciar(self, dia):
+        self._dia = dia
+        self._apontados = {}          # chave -> linha do apontamento
+        self._com_checklist = set()
+        self._marca_id = 0
+        self._marca_check = None
+        self._proxima_sync = 0.0
+
+    @staticmethod
+    def _chave(numero_serie, tipo_producao):
+        return _normaliza_codigo(numero_serie), _normaliza_codigo(tipo_producao)
+
+    def adicionar(self, linha: dict):
+        dia = _dia_local()
+        with self._lock:
+            if self._dia != dia:
+                self._reiniciar(dia)  # marcas zeradas: a próxima sincronização busca o dia inteiro
+            if linha["data_hora"] >= _inicio_do_dia_utc():
+                self._apontados.setdefault(self._chave(linha["numero_serie"], linha["tipo_producao"]), linha)
+
+    def remover(self, numero_serie, tipo_producao):
+        with self._lock:
+            self._com_checklist.add(self._chave(numero_serie, tipo_producao))
+
+    def sincronizar(self, cliente, forcar: bool = False, antecedencia: float = 0):
+        dia = _dia_local()
+        with self._lock:
+            if self._dia != dia:
+                self._reiniciar(dia)
+            if not forcar and time.monotonic() < self._proxima_sync - antecedencia:
+                return
+            marca_id, marca_check = self._marca_id, self._marca_check
+
+        # outra sessão já está buscando o delta → usa o que tem
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            estado = _cache_compartilhado().obter(
+                f"pendentes:{dia}", ("apontamentos", "checklists"), PENDENTES_DELTA_SEG,
+                lambda: self._buscar(cliente, dia, marca_id, marca_check),
+            )
+        except Exception:
+            with self._lock:
+                self._proxima_sync = time.monotonic() + PENDENTES_DELTA_SEG
+            raise
+        finally:
+            self._sync_lock.release()
+
+        self._mesclar(dia, estado)
+        with self._lock:
+            self._proxima_sync = time.monotonic() + PENDENTES_DELTA_SEG
+
+    def _buscar(self, cliente, dia, marca_id, marca_check) -> dict:
+        """
+        Delta do dia no Supabase, mesclado ao índice; devolve o estado inteiro (o que vai para o cache).
+        """
+        inicio_dia = _inicio_do_dia_utc()
+        apont = _selecionar_tudo(
+            lambda: cliente.table("apontamentos_manga_pnm")
+            .select("id, numero_serie, op, tipo_producao, data_hora")
+            .gte("data_hora", inicio_dia)
+            .gt("id", marca_id),
+            chave="id",
+        )
+        desde_check = inicio_dia
+        if marca_check:
+            desde_check = max(
+                inicio_dia,
+                (datetime.datetime.fromisoformat(marca_check) - datetime.timedelta(seconds=PENDENTES_MARGEM_SEG)).isoformat(),
+            )
+        check = []
+        for tabela in _tabelas_checklist():
+            check += _selecionar_tudo(
+                lambda: cliente.table(tabela)
+                .select("id, numero_serie, tipo_producao, data_hora")
+                .gte("data_hora", desde_check)
+            )
+        self._mesclar(dia, {"apontados": apont, "checklists": check})
+        with self._lock:
+            return {
+                "apontados": list(self._apontados.values()),
+                "checklists": [
+                    {"numero_serie": serie, "tipo_producao": tipo, "data_hora": self._marca_check}
+                    for serie, tipo in self._com_checklist
+                ],
+            }
+
+    def _mesclar(self, dia, estado: dict):
+        _indice_series().adicionar(*(_normaliza_codigo(r["numero_serie"]) for r in estado["apontados"]))
+        with self._lock:
+            if self._dia != dia:
+                return
+            for r in estado["apontados"]:
+                self._apontados[self._chave(r["numero_serie"], r["tipo_producao"])] = r
+                # linhas gravadas por um processo e ainda no journal dele não têm id
+                self._marca_id = max(self._marca_id, r.get("id") or 0)
+            for r in estado["checklists"]:
+                self._com_checklist.add(self._chave(r["numero_serie"], r["tipo_producao"]))
+                if r["data_hora"]:
+                    self._marca_check = max(self._marca_check or r["data_hora"], r["data_hora"])
+
+    def resumo(self) -> tuple[int, int]:
+        """
+        (apontados hoje, pendentes)
+        """
+        with self._lock:
+            return len(self._apontados), len(self._apontados.keys() - self._com_checklist)
+
+    def pendentes(self) -> pd.DataFrame:
+        with self._lock:
+            linhas = [dict(l) for k, l in self._apontados.items() if k not in self._com_checklist]
+        df = pd.DataFrame(linhas, columns=["numero_serie", "op", "tipo_producao", "data_hora"])
+        if df.empty:
+            return df
+        df["numero_serie"] = df["numero_serie"].map(_normaliza_codigo)
+        df["data_hora"] = pd.to_datetime(df["data_hora"], utc=True, format="ISO8601").dt.tz_convert(TZ)
+        return df.sort_values("data_hora", ascending=False).reset_index(drop=True)
+
+
+@st.cache_resource
+def _indice_pendentes() -> IndicePendentes:
+    return IndicePendentes()
+
 # ==============================
 # CALLBACK DO LEITOR
 # ==============================
+@_medido("callback", "processar_leitura")
 def processar_leitura():
     leitura = _normaliza_codigo(st.session_state.get("input_leitor", ""))
     if not leitura:
         return
 
-    if len(leitura) == 9:
+    if st.session_state.get("modo_lote"):
+        _leitura_lote(leitura)
+
+    elif len(leitura) == 9:
         st.session_state["numero_serie"] = leitura
         st.session_state["erro"] = None
 
@@ -272,65 +2835,474 @@ def processar_leitura():
                 st.session_state.get("usuario", "Operador_Logado")
             )
 
-            if sucesso:
-                st.session_state["sucesso"] = "✅ Apontamento realizado"
-                st.session_state["numero_serie"] = ""
-                st.session_state["op"] = ""
-            else:
-                st.session_state["erro"] = erro
+            if sucesso:
+                st.session_state["sucesso"] = "✅ Apontamento realizado" if _indice_series().carregado.is_set() \
+                    else "✅ Apontamento realizado (duplicidade conferida no envio)"
+                st.session_state["numero_serie"] = ""
+                st.session_state["op"] = ""
+            else:
+                st.session_state["erro"] = erro
+
+    st.session_state["input_leitor"] = ""
+
+def _leitura_lote(leitura):
+    """
+    Modo lote: só valida (tamanho, série antes da OP, repetição) e guarda o par;
+    nada vai ao journal até o operador gravar o lote.
+    """
+    lote = st.session_state.setdefault("lote", [])
+
+    if len(leitura) == 9:
+        if any(p["numero_serie"] == leitura for p in lote):
+            st.session_state["erro"] = f"⚠️ Série {leitura} já está no lote"
+        elif _indice_series().conferir([leitura]):
+            st.session_state["erro"] = f"Série {leitura} já apontada."
+        else:
+            st.session_state["numero_serie"] = leitura
+            st.session_state["erro"] = None
+
+    elif len(leitura) == 11:
+        if not st.session_state.get("numero_serie"):
+            st.session_state["erro"] = "⚠️ Leia primeiro o número de série"
+        elif len(lote) >= LOTE_MAX_PARES:
+            st.session_state["erro"] = f"⚠️ Lote cheio ({LOTE_MAX_PARES} pares) — grave o lote antes de continuar"
+        else:
+            lote.append({
+                "numero_serie": st.session_state["numero_serie"],
+                "op": leitura,
+                "data_hora": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            })
+            st.session_state["numero_serie"] = ""
+
+def gravar_lote():
+    lote = st.session_state.get("lote") or []
+    if not lote:
+        return
+    st.session_state["lote_resultado"] = salvar_apontamentos_lote(
+        lote,
+        st.session_state.get("tipo_producao"),
+        st.session_state.get("usuario", "Operador_Logado"),
+    )
+    st.session_state["lote"] = []
+    st.session_state["numero_serie"] = ""
+
+def limpar_lote():
+    st.session_state["lote"] = []
+    st.session_state["numero_serie"] = ""
+
+# ==============================
+# PÁGINA APONTAMENTO
+# ==============================
+def pagina_apontamento():
+    st.title("📦 Apontamento MANGA / PNM")
+
+    st.radio(
+        "Tipo do Produto",
+        ["MANGA", "PNM"],
+        key="tipo_producao",
+        horizontal=True
+    )
+    st.toggle("📦 Modo lote (doca)", key="modo_lote", help="Acumula pares série/OP e grava todos de uma vez")
+
+    st.text_input(
+        "Leitor",
+        key="input_leitor",
+        placeholder="Aproxime o leitor...",
+        label_visibility="collapsed",
+        on_change=processar_leitura
+    )
+
+    components.html("""
+    <script>
+    function focar(){
+        const i = window.parent.document.querySelector('input[id^="input_leitor"]');
+        if(i){ i.focus(); }
+    }
+    focar();
+    new MutationObserver(focar).observe(
+        window.parent.document.body,
+        {childList:true, subtree:true}
+    );
+    </script>
+    """, height=0)
+
+    if st.session_state.get("modo_lote"):
+        _painel_lote()
+    else:
+        col1, col2 = st.columns(2)
+        col1.markdown(f"📦 Série: **{st.session_state.get('numero_serie','-')}**")
+        col2.markdown(f"🧾 OP: **{st.session_state.get('op','-')}**")
+
+    if st.session_state.get("erro"):
+        st.error(st.session_state["erro"])
+        st.session_state["erro"] = None
+
+    if st.session_state.get("sucesso"):
+        st.success(st.session_state["sucesso"])
+        st.session_state["sucesso"] = None
+
+    if supabase.offline:
+        st.warning("🔌 Sem conexão com o servidor — as leituras continuam valendo: ficam guardadas "
+                   "neste posto e sobem sozinhas quando a conexão voltar.")
+    resumo = _journal().resumo(_inicio_do_dia_utc())
+    if resumo["pendentes"]:
+        msg = f"📡 {resumo['pendentes']} leitura(s) aguardando envio ao servidor"
+        if resumo["com_erro"]:
+            msg += f" — {resumo['com_erro']} com falha de envio, tentando novamente"
+        st.caption(msg)
+    if resumo["duplicados"]:
+        st.warning("⚠️ Séries já apontadas em outro posto (não enviadas): " + ", ".join(resumo["duplicados"]))
+
+    if st.toggle("🔴 Ao vivo", key="feed_ao_vivo", help=f"Atualiza a tabela sozinha a cada {FEED_POLL_SEG}s"):
+        _tabela_apontamentos_ao_vivo()
+    else:
+        _tabela_apontamentos()
+
+    if st.toggle("📜 Histórico por dia", key="historico_aberto"):
+        _historico_apontamentos()
+    else:
+        st.session_state.pop("historico", None)
+
+HISTORICO_PAGINA = 50
+
+def _historico_apontamentos():
+    """
+    Apontamentos de um dia local, do servidor, HISTORICO_PAGINA por vez.
+    """
+    hoje = datetime.datetime.now(TZ).date()
+    dia = st.date_input("Dia", hoje, max_value=hoje, key="historico_dia")
+    estado = st.session_state.get("historico")
+    if not estado or estado["dia"] != dia:
+        estado = st.session_state["historico"] = {"dia": dia, "paginas": [], "cursor": None, "fim": False, "erro": None}
+        _historico_proxima(estado)
+
+    if estado["erro"]:
+        st.warning(f"⚠️ Não consegui buscar o histórico: {estado['erro']}")
+    if estado["paginas"]:
+        df = pd.concat(estado["paginas"], ignore_index=True)
+        st.caption(f"{len(df)} apontamento(s) em {dia:%d/%m/%Y}" + ("" if estado["fim"] else " (há mais)"))
+        st.dataframe(df.drop(columns="id"), use_container_width=True)
+    elif estado["fim"]:
+        st.caption("Nenhum apontamento neste dia.")
+    if not estado["fim"]:
+        st.button("⬇️ Mais antigos", key="historico_mais", on_click=_historico_proxima, args=(estado,))
+
+def _historico_proxima(estado):
+    try:
+        with supabase.prazo(PRAZO_TELA_SEG):
+            df, estado["cursor"] = listar_apontamentos(HISTORICO_PAGINA, estado["cursor"], *janela_utc(estado["dia"]))
+    except Exception as e:
+        estado["erro"] = str(e)
+        return
+    estado["erro"] = None
+    if not df.empty:
+        estado["paginas"].append(df)
+    estado["fim"] = estado["cursor"] is None
+
+def _painel_lote():
+    lote = st.session_state.get("lote") or []
+    col1, col2 = st.columns(2)
+    col1.markdown(f"📦 Série aguardando OP: **{st.session_state.get('numero_serie') or '-'}**")
+    col2.markdown(f"🧺 Pares no lote: **{len(lote)}** / {LOTE_MAX_PARES}")
+
+    if lote:
+        st.dataframe(
+            pd.DataFrame(lote[::-1])[["numero_serie", "op"]],
+            hide_index=True, use_container_width=True, height=min(35 * len(lote) + 38, 300),
+        )
+    c1, c2 = st.columns(2)
+    c1.button(f"✅ Gravar lote ({len(lote)})", type="primary", disabled=not lote,
+              on_click=gravar_lote, use_container_width=True)
+    c2.button("🗑️ Limpar lote", disabled=not lote, on_click=limpar_lote, use_container_width=True)
+
+    if st.session_state.get("lote_resultado"):
+        _resultado_lote()
+
+RESULTADO_LOTE = {
+    "salva": "✅ salva",
+    "enviando": "⏳ enviando",
+    "duplicada": "⚠️ duplicada",
+    "erro": "❌ erro",
+}
+
+@st.fragment(run_every=FLUSH_INTERVALO_SEG)
+def _resultado_lote():
+    """
+    Resultado do último lote, por linha. As gravadas no journal seguem o envio
+    do flusher: enviando → salva, ou duplicada (já apontada em outro posto).
+    """
+    resultado = st.session_state["lote_resultado"]
+    situacao = _journal().situacao([r["numero_serie"] for r in resultado if r["resultado"] == "gravada"])
+
+    linhas = []
+    for r in resultado:
+        final, detalhe = r["resultado"], r["detalhe"]
+        if final == "gravada":
+            s = situacao.get(r["numero_serie"], {})
+            if s.get("status") == "enviado":
+                final = "salva"
+            elif s.get("status") == "duplicado":
+                final, detalhe = "duplicada", "já apontada em outro posto"
+            else:
+                final = "enviando"
+                if s.get("tentativas"):
+                    detalhe = f"falha de envio, tentando novamente: {s.get('ultimo_erro')}"
+        linhas.append({"numero_serie": r["numero_serie"], "op": r["op"], "resultado": RESULTADO_LOTE[final], "detalhe": detalhe})
+
+    contagem = collections.Counter(l["resultado"] for l in linhas)
+    st.caption("Último lote: " + " · ".join(f"{rotulo} {contagem[rotulo]}" for rotulo in RESULTADO_LOTE.values() if contagem[rotulo]))
+    st.dataframe(pd.DataFrame(linhas), hide_index=True, use_container_width=True)
+
+def _tabela_apontamentos():
+    df = carregar_apontamentos()
+    if not df.empty:
+        st.dataframe(df, use_container_width=True)
+
+@st.fragment(run_every=FEED_POLL_SEG)
+@_medido("pagina", "Apontamento (ao vivo)")
+def _tabela_apontamentos_ao_vivo():
+    # só este trecho roda de novo a cada ciclo — o leitor e o resto da página ficam parados
+    _tabela_apontamentos()
+
+# ==============================
+# MODELOS DE CHECKLIST (versionados por tipo)
+# ==============================
+class ModeloChecklist:
+    """
+    Modelo validado e compilado: itens numerados (1..n) prontos para o formulário
+    e a ordem das chaves que status_itens segue nessa versão.
+    Versão publicada não muda — para mexer nas perguntas, crie <TIPO>_v<N+1>.json.
+    """
+
+    COMPLEMENTOS = {"opcoes", "texto", "sim_nao"}
+
+    def __init__(self, definicao: dict, origem: str = ""):
+        self.validar(definicao, origem)
+        self.tipo_producao = definicao["tipo_producao"]
+        self.versao = definicao["versao"]
+        self.itens = tuple(
+            {
+                "numero": i,
+                "chave": item["chave"],
+                "rotulo": f"**{i}. {item['pergunta']}**",
+                "complemento": item.get("complemento"),
+            }
+            for i, item in enumerate(definicao["itens"], start=1)
+        )
+        self.chaves = tuple(item["chave"] for item in self.itens)
+
+    @classmethod
+    def validar(cls, definicao: dict, origem: str = ""):
+        def erro(msg):
+            raise ValueError(f"{origem or 'modelo'}: {msg}")
+
+        tipo, versao, itens = definicao.get("tipo_producao"), definicao.get("versao"), definicao.get("itens")
+        if not tipo or not isinstance(versao, int) or versao < 1:
+            erro("precisa de tipo_producao e versao (inteiro >= 1)")
+        if origem and origem != f"{tipo}_v{versao}.json":
+            erro(f"o nome do arquivo deve ser {tipo}_v{versao}.json")
+        if not isinstance(itens, list) or not itens:
+            erro("sem itens")
+        vistas = set()
+        for i, item in enumerate(itens, start=1):
+            chave = item.get("chave")
+            if not chave or not str(chave).replace("_", "").isalnum() or chave != str(chave).upper():
+                erro(f"item {i}: chave inválida ({chave!r}); use MAIUSCULAS_COM_SUBLINHADO")
+            if chave in vistas:
+                erro(f"item {i}: chave repetida {chave}")
+            vistas.add(chave)
+            if not item.get("pergunta"):
+                erro(f"item {i} ({chave}): sem pergunta")
+            complemento = item.get("complemento")
+            if complemento is not None:
+                if complemento.get("tipo") not in cls.COMPLEMENTOS:
+                    erro(f"item {i} ({chave}): complemento deve ser um de {sorted(cls.COMPLEMENTOS)}")
+                if complemento["tipo"] == "opcoes" and not complemento.get("opcoes"):
+                    erro(f"item {i} ({chave}): complemento 'opcoes' sem opções")
+
+    def codificar(self, resultados: dict, complementos: dict) -> tuple[str, dict]:
+        """
+        resultados/complementos indexados pelo número do item → (status_itens, complementos por chave).
+        """
+        status_itens = "".join(
+            STATUS_PARA_CODIGO[status_emoji_para_texto(resultados[i])] if resultados.get(i) else "-"
+            for i in range(1, len(self.itens) + 1)
+        )
+        return status_itens, {self.chaves[i - 1]: c for i, c in complementos.items() if c}
+
 
-    st.session_state["input_leitor"] = ""
+class ModelosChecklist:
+    """
+    Modelos por (tipo, versão), lidos de MODELOS_CHECKLIST_PASTA. Cada arquivo é
+    validado e compilado uma vez; a pasta é reolhada no máximo a cada
+    MODELOS_VERIFICAR_SEG e só arquivos novos ou alterados são relidos. A versão
+    atual de cada tipo é a maior válida; as antigas ficam para decodificar o histórico.
+    _modelos e erros são trocados inteiros a cada releitura (nunca alterados no
+    lugar): quem lê sem o lock vê a versão anterior ou a nova, nunca uma pela metade.
+    """
+
+    def __init__(self, pasta: Path):
+        self.pasta = pasta
+        self._lock = threading.Lock()
+        self._modelos = {}    # (tipo, versao) -> ModeloChecklist
+        self._lidos = {}      # nome do arquivo -> mtime
+        self._ausentes = set()
+        self._proxima = 0.0
+        self.erros = {}       # nome do arquivo -> mensagem
+        self._recarregar(forcar=True)
+
+    def _recarregar(self, forcar: bool = False):
+        if not forcar and time.monotonic() < self._proxima:
+            return
+        with self._lock:
+            modelos, erros = dict(self._modelos), dict(self.erros)
+            for caminho in sorted(self.pasta.glob("*.json")):
+                try:
+                    mtime = caminho.stat().st_mtime
+                    if self._lidos.get(caminho.name) == mtime:
+                        continue
+                    self._lidos[caminho.name] = mtime
+                    modelo = ModeloChecklist(json.loads(caminho.read_text(encoding="utf-8")), caminho.name)
+                except (OSError, ValueError) as e:
+                    erros[caminho.name] = str(e)
+                    log.warning("modelos de checklist: %s ignorado: %s", caminho.name, e)
+                    continue
+                erros.pop(caminho.name, None)
+                modelos[(modelo.tipo_producao, modelo.versao)] = modelo
+            self._modelos, self.erros = modelos, erros
+            self._proxima = time.monotonic() + MODELOS_VERIFICAR_SEG
+
+    def atual(self, tipo_producao: str) -> ModeloChecklist:
+        self._recarregar()
+        modelos = self._modelos
+        versoes = [v for (t, v) in modelos if t == tipo_producao]
+        if not versoes:
+            raise KeyError(f"Nenhum modelo de checklist válido para {tipo_producao} em {self.pasta}")
+        return modelos[(tipo_producao, max(versoes))]
+
+    def versao(self, tipo_producao: str, versao) -> ModeloChecklist | None:
+        """
+        Modelo de uma versão já gravada (None/ausente = 1, linhas de antes do versionamento).
+        """
+        chave = (tipo_producao, int(versao or 1))
+        modelo = self._modelos.get(chave)
+        if modelo is None:
+            with self._lock:
+                primeira_vez = chave not in self._ausentes
+                self._ausentes.add(chave)
+            if primeira_vez:
+                self._recarregar(forcar=True)
+                modelo = self._modelos.get(chave)
+        return modelo
+
+    def chaves(self, tipo_producao: str, versao, n: int) -> tuple:
+        """
+        Chaves na ordem de status_itens; versão desconhecida vira ITEM_1..ITEM_n.
+        """
+        modelo = self.versao(tipo_producao, versao)
+        return modelo.chaves if modelo else tuple(f"ITEM_{i}" for i in range(1, n + 1))
+
+
+@st.cache_resource
+def _modelos_checklist() -> ModelosChecklist:
+    return ModelosChecklist(MODELOS_CHECKLIST_PASTA)
 
 # ==============================
-# PÁGINA APONTAMENTO
+# CHECKLIST – FORMATO COMPACTO
 # ==============================
-def pagina_apontamento():
-    st.title("📦 Apontamento MANGA / PNM")
+# 1 caractere por item, na ordem dos itens do modelo; "-" = item não perguntado
+STATUS_PARA_CODIGO = {"Conforme": "C", "Não Conforme": "N", "N/A": "A"}
+CODIGO_PARA_STATUS = {v: k for k, v in STATUS_PARA_CODIGO.items()}
 
-    st.radio(
-        "Tipo do Produto",
-        ["MANGA", "PNM"],
-        key="tipo_producao",
-        horizontal=True
-    )
+COLUNAS_CHECKLIST = ["numero_serie", "tipo_producao", "item", "status", "usuario", "data_hora"]
 
-    st.text_input(
-        "Leitor",
-        key="input_leitor",
-        placeholder="Aproxime o leitor...",
-        label_visibility="collapsed",
-        on_change=processar_leitura
-    )
+def _tabelas_checklist() -> list[str]:
+    if CHECKLIST_LER_FORMATO_ANTIGO:
+        return [TABELA_CHECKLIST, TABELA_CHECKLIST_ANTIGA]
+    return [TABELA_CHECKLIST]
 
-    components.html("""
-    <script>
-    function focar(){
-        const i = window.parent.document.querySelector('input[id^="input_leitor"]');
-        if(i){ i.focus(); }
+def montar_checklist_compacto(numero_serie, tipo_producao, usuario, resultados: dict, complementos: dict,
+                              modelo: ModeloChecklist | None = None) -> dict:
+    """
+    resultados/complementos indexados pelo número do item no modelo (o que o formulário mostrou).
+    """
+    modelo = modelo or _modelos_checklist().atual(tipo_producao)
+    status_itens, complementos = modelo.codificar(resultados, complementos)
+    return {
+        "numero_serie": numero_serie,
+        "tipo_producao": tipo_producao,
+        "usuario": usuario,
+        "status_itens": status_itens,
+        "complementos": complementos,
+        "modelo_versao": modelo.versao,
+        "data_hora": datetime.datetime.now(datetime.timezone.utc).isoformat()
     }
-    focar();
-    new MutationObserver(focar).observe(
-        window.parent.document.body,
-        {childList:true, subtree:true}
-    );
-    </script>
-    """, height=0)
 
-    col1, col2 = st.columns(2)
-    col1.markdown(f"📦 Série: **{st.session_state.get('numero_serie','-')}**")
-    col2.markdown(f"🧾 OP: **{st.session_state.get('op','-')}**")
+def expandir_checklists(linhas: list[dict]) -> pd.DataFrame:
+    """
+    Linhas compactas → mesmo formato da tabela antiga (uma linha por item),
+    cada uma decodificada pela versão do modelo com que foi gravada.
+    """
+    modelos = _modelos_checklist()
+    registros = []
+    for linha in linhas:
+        complementos = linha.get("complementos") or {}
+        status_itens = linha.get("status_itens") or ""
+        chaves = modelos.chaves(linha["tipo_producao"], linha.get("modelo_versao"), len(status_itens))
+        for chave, codigo in zip(chaves, status_itens):
+            if codigo == "-":
+                continue
+            item = f"{chave} - {complementos[chave]}" if complementos.get(chave) else chave
+            registros.append({
+                "numero_serie": linha["numero_serie"],
+                "tipo_producao": linha["tipo_producao"],
+                "item": item,
+                "status": CODIGO_PARA_STATUS.get(codigo),
+                "usuario": linha.get("usuario"),
+                "data_hora": linha["data_hora"],
+            })
+    return pd.DataFrame(registros, columns=COLUNAS_CHECKLIST)
 
-    if st.session_state.get("erro"):
-        st.error(st.session_state["erro"])
-        st.session_state["erro"] = None
+def salvar_checklist(numero_serie, tipo_producao, usuario, resultados: dict, complementos: dict,
+                     modelo: ModeloChecklist | None = None, chave: str | None = None) -> dict:
+    """
+    Grava o checklist (1 linha compacta, com a versão do modelo) e tira a série das pendências.
+    A mesma `chave` de novo (salvar outra vez depois de erro ou timeout) não duplica a inspeção.
+    """
+    registro = montar_checklist_compacto(numero_serie, tipo_producao, usuario, resultados, complementos, modelo)
+    registro["chave"] = chave or uuid.uuid4().hex
+    supabase.table(TABELA_CHECKLIST).upsert(registro, on_conflict="chave", ignore_duplicates=True).execute()
+    _indice_pendentes().remover(numero_serie, tipo_producao)
+    _cache_compartilhado().invalidar("checklists")
+    return registro
 
-    if st.session_state.get("sucesso"):
-        st.success(st.session_state["sucesso"])
-        st.session_state["sucesso"] = None
+def ler_checklists(desde_utc: str, ate_utc: str, tipo_producao: str | None = None) -> pd.DataFrame:
+    """
+    Checklists entre desde_utc e ate_utc (ISO, UTC), dos dois formatos,
+    sempre no formato expandido: numero_serie, tipo_producao, item, status, usuario, data_hora.
+    """
+    def consulta(tabela, colunas):
+        q = supabase.table(tabela).select(colunas).gte("data_hora", desde_utc).lt("data_hora", ate_utc)
+        if tipo_producao:
+            q = q.eq("tipo_producao", tipo_producao)
+        return q
 
-    df = carregar_apontamentos()
-    if not df.empty:
-        st.dataframe(df, use_container_width=True)
+    partes = [expandir_checklists(_selecionar_tudo(
+        lambda: consulta(TABELA_CHECKLIST, "id, numero_serie, tipo_producao, usuario, status_itens, complementos, modelo_versao, data_hora")
+    ))]
+    if CHECKLIST_LER_FORMATO_ANTIGO:
+        partes.append(pd.DataFrame(
+            _selecionar_tudo(lambda: consulta(TABELA_CHECKLIST_ANTIGA, "id, " + ", ".join(COLUNAS_CHECKLIST))),
+            columns=COLUNAS_CHECKLIST,
+        ))
+
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return pd.DataFrame(columns=COLUNAS_CHECKLIST)
+
+    df = pd.concat(partes, ignore_index=True)
+    df["data_hora"] = pd.to_datetime(df["data_hora"], utc=True, format="ISO8601").dt.tz_convert(TZ)
+    return df
 
 # ==============================
 # CHECKLIST DE QUALIDADE
@@ -343,60 +3315,22 @@ def checklist_qualidade_manga_pnm(numero_serie, tipo_producao, usuario, op):
 
     st.markdown(f"## ✔️ Checklist – Série: {numero_serie} | OP: {op} | {tipo_producao}")
 
-    perguntas = [
-        "Etiqueta do produto – As informações estão corretas / legíveis conforme modelo e gravação do eixo?",
-        "Placa do Inmetro está correta / fixada e legível? Número corresponde à viga? Gravação do número de série da viga está legível e pintada?",
-        "Etiqueta do ABS está conforme? Com número de série compatível ao da viga? Teste do ABS está aprovado?",
-        "Rodagem – tipo correto? Especifique o modelo",
-        "Graxeiras e Anéis elásticos estão em perfeito estado?",
-        "Sistema de atuação correto? Springs ou cuícas em perfeitas condições? Especifique o modelo:",
-        "Catraca do freio correta? Especifique modelo",
-        "Tampa do cubo correta, livre de avarias e pintura nos critérios? As tampas dos cubos dos ambos os lados são iguais?",
-        "Pintura do eixo livre de oxidação, isento de escorrimento, pontos sem tinta e camada conforme padrão?",
-        "Os cordões de solda do eixo estão conformes?",
-        "As caixas estão corretas? Escreva qual o modelo:",
-        "Etiqueta pede suspensor?",
-        "Etiqueta pede Suporte da Bolsa?",
-        "Etiqueta pede Mão Francesa?"
-    ]
-
-    if tipo_producao == "MANGA":
-        perguntas.append("Grau do Manga conforme etiqueta do produto? Escreva qual o Grau:")
-
-    item_keys = {
-        1: "ETIQUETA",
-        2: "PLACA_IMETRO_E_NUMERO_SERIE",
-        3: "TESTE_ABS",
-        4: "RODAGEM",
-        5: "GRAXEIRAS",
-        6: "SISTEMA_ATUACAO",
-        7: "CATRACA_FREIO",
-        8: "TAMPA_CUBO",
-        9: "PINTURA_EIXO",
-        10: "SOLDA",
-        11: "CAIXAS",
-        12: "FALTA_SUSPENSOR",
-        13: "FALTA_SPT_BOLSA",
-        14: "FALTA_MAO_FRANCESA",
-        15: "GRAU_DIVERGENTE"
-    }
-
-    opcoes_modelos = {
-        4: ["Single", "Aço", "Alumínio", "N/A"],
-        6: ["Spring", "Cuíca", "N/A"],
-        7: ["Automático", "Manual", "N/A"],
-        10: ["Conforme", "Respingo", "Falta de cordão", "Porosidade", "Falta de Fusão"]
-    }
+    try:
+        modelo = _modelos_checklist().atual(tipo_producao)
+    except KeyError as e:
+        st.error(f"❌ {e}")
+        return
 
     resultados = {}
     complementos = {}
 
-    st.caption("✅ = Conforme | ❌ = Não Conforme | 🟡 = N/A")
+    st.caption(f"✅ = Conforme | ❌ = Não Conforme | 🟡 = N/A · modelo {tipo_producao} v{modelo.versao}")
 
     with st.form(key=f"form_checklist_{numero_serie}", clear_on_submit=False):
-        for i, pergunta in enumerate(perguntas, start=1):
+        for item in modelo.itens:
+            i, complemento = item["numero"], item["complemento"] or {}
             cols = st.columns([7, 2, 2])
-            cols[0].markdown(f"**{i}. {pergunta}**")
+            cols[0].markdown(item["rotulo"])
 
             resultados[i] = cols[1].radio(
                 "",
@@ -407,20 +3341,20 @@ def checklist_qualidade_manga_pnm(numero_serie, tipo_producao, usuario, op):
                 label_visibility="collapsed"
             )
 
-            if i in opcoes_modelos:
+            if complemento.get("tipo") == "opcoes":
                 complementos[i] = cols[2].selectbox(
                     "Modelo",
-                    [""] + opcoes_modelos[i],
+                    [""] + complemento["opcoes"],
                     key=f"modelo_{numero_serie}_{i}",
                     label_visibility="collapsed"
                 )
-            elif i in [11, 15]:
+            elif complemento.get("tipo") == "texto":
                 complementos[i] = cols[2].text_input(
                     "",
                     key=f"texto_{numero_serie}_{i}",
                     label_visibility="collapsed"
                 )
-            elif i in [12, 13, 14]:
+            elif complemento.get("tipo") == "sim_nao":
                 complementos[i] = cols[2].selectbox(
                     "",
                     ["", "Sim", "Não"],
@@ -448,29 +3382,21 @@ def checklist_qualidade_manga_pnm(numero_serie, tipo_producao, usuario, op):
                 st.error("⚠️ Responda todos os itens")
                 return
 
-            # ✅ NÃO obriga foto: salva sempre o checklist
-            registros = []
-            for i in resultados:
-                item_final = item_keys[i]
-                if complementos.get(i):
-                    item_final = f"{item_final} - {complementos[i]}"
-
-                registros.append({
-                    "numero_serie": numero_serie,
-                    "tipo_producao": tipo_producao,
-                    "item": item_final,
-                    "status": status_emoji_para_texto(resultados[i]),
-                    "usuario": usuario,
-                    "data_hora": datetime.datetime.now(datetime.timezone.utc).isoformat()
-                })
-            supabase.table("checklists_manga_pnm_detalhes").insert(registros).execute()
-
-            urls = []
-            paths = []
-
-            # ✅ Foto opcional: só faz upload se anexou
-            if foto_vista_superior is not None:
-                url, storage_path, _ = upload_foto_para_supabase_storage(
+            # ✅ NÃO obriga foto: salva sempre o checklist (1 linha compacta por inspeção).
+            # Checklist (insert no servidor) e foto (fila local) não dependem um do outro:
+            # saem ao mesmo tempo e cada um informa o próprio resultado.
+            # A mesma foto não entra duas vezes na fila se o operador salvar de novo.
+            enfileiradas = st.session_state.setdefault("fotos_enfileiradas", set())
+            foto_nova = foto_vista_superior is not None and foto_vista_superior.file_id not in enfileiradas
+
+            # a chave só muda depois de salvar: a tentativa seguinte a um erro repete a mesma
+            chave_checklist = st.session_state.setdefault(f"checklist_chave_{numero_serie}", uuid.uuid4().hex)
+            envios = {"checklist": lambda: salvar_checklist(
+                numero_serie, tipo_producao, usuario, resultados, complementos, modelo, chave_checklist
+            )}
+            if foto_nova:
+                # ✅ Foto opcional: só coloca na fila se anexou (envio em segundo plano)
+                envios["foto"] = lambda: enfileirar_foto(
                     numero_serie=numero_serie,
                     tipo_producao=tipo_producao,
                     op=op,
@@ -478,43 +3404,104 @@ def checklist_qualidade_manga_pnm(numero_serie, tipo_producao, usuario, op):
                     arquivo=foto_vista_superior,
                     origem="vista_superior"
                 )
-                if storage_path:
-                    paths.append(storage_path)
-                if url:
-                    urls.append(url)
+            feitos, erros = em_paralelo(envios)
 
-            if paths:
-                st.success(f"✅ {len(paths)} foto enviada para o Storage.")
-                st.code("\n".join(paths))
+            if feitos.get("foto"):
+                enfileiradas.add(foto_vista_superior.file_id)
+            if "checklist" not in erros:
+                st.session_state.pop(f"checklist_chave_{numero_serie}", None)
+            foto_na_fila = foto_vista_superior is not None and foto_vista_superior.file_id in enfileiradas
 
-            if urls:
-                st.success("✅ Checklist salvo + foto ok.")
+            if "checklist" in erros:
+                msg = f"❌ Checklist NÃO foi salvo: {erros['checklist']}"
+                if foto_na_fila:
+                    msg += " — a foto já está na fila de envio; ao salvar de novo ela não é reenviada."
+                aviso = ("error", msg)
+            elif (feitos.get("foto") or {}).get("repetida"):
+                aviso = ("success", "✅ Checklist salvo — essa foto já estava na fila de envio desta série.")
+            elif foto_na_fila:
+                aviso = ("success", "✅ Checklist salvo + foto na fila de envio.")
+            elif foto_vista_superior is not None:
+                aviso = ("warning", f"✅ Checklist salvo, mas a foto não entrou na fila de envio: {erros.get('foto')}")
             else:
-                st.success("✅ Checklist salvo (sem foto).")
+                aviso = ("success", "✅ Checklist salvo (sem foto).")
 
-            st.session_state["checklist_salvo"] = True
+            # o rerun tira a série das pendências; o aviso sai no topo da página
+            st.session_state["checklist_aviso"] = aviso
             st.rerun()
 
-    # ✅ mostra o que está salvo na tabela e no storage
+    painel_envio_fotos(numero_serie)
+
+    painel_fotos_da_serie(numero_serie, tipo_producao)
+
+
+def painel_fotos_da_serie(numero_serie, tipo_producao):
+    """
+    Fotos/debug da série — só busca alguma coisa quando o operador abre o painel.
+    """
     st.divider()
-    st.markdown(f"### 🔎 Debug — Série **{numero_serie}**")
+    if not st.toggle(f"🔎 Debug / fotos — Série {numero_serie}", key=f"painel_fotos_{numero_serie}"):
+        st.session_state.pop(f"fotos_antigas_{numero_serie}", None)
+        return
+
+    st.markdown("**Tabela `checklists_manga_pnm_fotos` (mais recentes primeiro):**")
+    try:
+        with supabase.prazo(PRAZO_TELA_SEG):
+            df_fotos, cursor = listar_fotos_da_serie(numero_serie, tipo_producao=tipo_producao)
+    except Exception as e:
+        st.warning(f"⚠️ Não consegui buscar as fotos da série: {e}")
+        return
+
+    # páginas mais antigas ficam na sessão até o painel fechar
+    chave_antigas = f"fotos_antigas_{numero_serie}"
+    antigas = st.session_state.setdefault(chave_antigas, {"paginas": [], "cursor": cursor})
+    if antigas["paginas"]:
+        df_fotos = pd.concat([df_fotos, *antigas["paginas"]], ignore_index=True)
+    if antigas["cursor"] is not None:
+        def mais_antigas():
+            df, antigas["cursor"] = listar_fotos_da_serie(numero_serie, tipo_producao, cursor=antigas["cursor"])
+            antigas["paginas"].append(df)
+        st.button("⬇️ Fotos mais antigas", key=f"fotos_mais_{numero_serie}", on_click=mais_antigas)
 
-    st.markdown("**Tabela `checklists_manga_pnm_fotos` (últimas 50):**")
-    df_fotos = listar_fotos_da_serie(numero_serie, tipo_producao=tipo_producao)
     if df_fotos.empty:
         st.caption("Nenhum registro na tabela ainda.")
     else:
-        cols_show = [c for c in ["data_hora", "numero_serie", "tipo_producao", "op", "usuario", "origem", "nome_arquivo", "storage_path", "url"] if c in df_fotos.columns]
+        cols_show = [c for c in ["data_hora", "numero_serie", "tipo_producao", "op", "usuario", "origem", "nome_arquivo", "tamanho", "storage_path", "url"] if c in df_fotos.columns]
         st.dataframe(df_fotos[cols_show], use_container_width=True)
 
-    st.markdown("**Storage (prefixo do bucket):**")
+        # galeria: só miniaturas, por origem (a foto inteira abre pelo link da url)
+        if "thumb_url" in df_fotos.columns:
+            thumbs = df_fotos[df_fotos["thumb_url"].fillna("") != ""]
+            for origem, grupo in thumbs.groupby(thumbs["origem"].fillna(""), sort=False):
+                st.caption(origem or "sem origem")
+                st.image(grupo["thumb_url"].tolist(), width=MINIATURA_LADO // 2)
+
+    # conferência direta no bucket: lenta (list() do prefixo), só sob demanda
     prefixo = f"{_sanitize(tipo_producao)}/{_sanitize(numero_serie)}/"
-    arquivos = listar_arquivos_no_storage(prefixo)
-    if not arquivos:
-        st.caption(f"Nenhum arquivo encontrado no Storage com prefixo: {prefixo}")
-    else:
-        st.success(f"✅ Achei {len(arquivos)} arquivo(s) no Storage com prefixo: {prefixo}")
-        st.write([a.get("name") for a in arquivos if isinstance(a, dict)])
+    if st.button("📂 Conferir arquivos no Storage", key=f"listar_storage_{numero_serie}"):
+        arquivos = listar_arquivos_no_storage(prefixo)
+        if not arquivos:
+            st.caption(f"Nenhum arquivo encontrado no Storage com prefixo: {prefixo}")
+        else:
+            st.success(f"✅ Achei {len(arquivos)} arquivo(s) no Storage com prefixo: {prefixo}")
+            # confere com o manifesto (tamanho gravado no envio) sem baixar nada
+            tamanhos = {}
+            if not df_fotos.empty and "tamanho" in df_fotos.columns:
+                tamanhos = dict(zip(df_fotos["nome_arquivo"], df_fotos["tamanho"]))
+            linhas = []
+            for a in arquivos:
+                if not isinstance(a, dict):
+                    continue
+                no_bucket = (a.get("metadata") or {}).get("size")
+                esperado = tamanhos.get(a.get("name"))
+                if "__thumb." in (a.get("name") or ""):
+                    situacao = "miniatura"
+                elif esperado is None or pd.isna(esperado):
+                    situacao = "fora da página / sem tamanho"
+                else:
+                    situacao = "ok" if no_bucket == esperado else f"tamanho difere (tabela {int(esperado)})"
+                linhas.append({"arquivo": a.get("name"), "tamanho": no_bucket, "manifesto": situacao})
+            st.dataframe(pd.DataFrame(linhas), use_container_width=True)
 
 
 # ==============================
@@ -523,43 +3510,32 @@ def checklist_qualidade_manga_pnm(numero_serie, tipo_producao, usuario, op):
 def pagina_checklist():
     st.title("🧾 Checklist de Qualidade")
 
-    df_apont = carregar_apontamentos()
-    hoje = datetime.datetime.now(TZ).date()
+    # resultado do último "Salvar" (gravado antes do rerun)
+    aviso = st.session_state.pop("checklist_aviso", None)
+    if aviso:
+        getattr(st, aviso[0])(aviso[1])
 
-    if df_apont.empty:
-        st.info("Nenhum apontamento hoje")
-        return
+    painel_envio_fotos()
 
-    df_hoje = df_apont[df_apont["data_hora"].dt.date == hoje]
+    indice = _indice_pendentes()
+    try:
+        with supabase.prazo(PRAZO_TELA_SEG):
+            indice.sincronizar(supabase)
+    except Exception as e:
+        st.warning(f"⚠️ Não consegui atualizar as pendências (mostrando a última lista): {e}")
 
-    if df_hoje.empty:
+    apontados, _ = indice.resumo()
+    if not apontados:
         st.info("Nenhum apontamento hoje")
         return
 
-    hoje_str = hoje.strftime("%Y-%m-%d")
-
-    checklists = supabase.table("checklists_manga_pnm_detalhes") \
-        .select("numero_serie, tipo_producao") \
-        .gte("data_hora", f"{hoje_str}T00:00:00") \
-        .lte("data_hora", f"{hoje_str}T23:59:59") \
-        .execute()
-
-    if checklists.data:
-        df_check = pd.DataFrame(checklists.data)
-        df_pendentes = df_hoje.merge(
-            df_check,
-            on=["numero_serie", "tipo_producao"],
-            how="left",
-            indicator=True
-        ).query('_merge == "left_only"').drop(columns="_merge")
-    else:
-        df_pendentes = df_hoje.copy()
+    df_pendentes = indice.pendentes()
 
     if df_pendentes.empty:
         st.success("✅ Todos os apontamentos de hoje já têm checklist salvo")
         return
 
-    opcoes_series = [_normaliza_codigo(x) for x in df_pendentes["numero_serie"].unique()]
+    opcoes_series = list(df_pendentes["numero_serie"].unique())
 
     numero_serie = st.selectbox(
         "Selecione a série",
@@ -567,9 +3543,6 @@ def pagina_checklist():
         key="serie_selecionada"
     )
 
-    df_pendentes = df_pendentes.copy()
-    df_pendentes["numero_serie"] = df_pendentes["numero_serie"].apply(_normaliza_codigo)
-
     df_sel = df_pendentes[df_pendentes["numero_serie"] == numero_serie]
     if df_sel.empty:
         st.warning("Série já inspecionada")
@@ -584,6 +3557,765 @@ def pagina_checklist():
         linha["op"]
     )
 
+# ==============================
+# PRÉ-CARGA (telas abrem da memória)
+# ==============================
+class PreCarga:
+    """
+    Thread de fundo do processo: mantém quentes o feed de apontamentos, as
+    pendências do dia, os modelos de checklist e, das primeiras PRECARGA_SERIES
+    séries pendentes, as fotos (manifesto + URLs). Cada fonte é renovada um
+    pouco antes de vencer, então trocar de página ou de série lê da memória.
+    Para quando nenhuma sessão aparece há PRECARGA_OCIOSO_SEG.
+    """
+
+    def __init__(self, cliente, feed: FeedApontamentos, indice: IndicePendentes):
+        self.cliente = cliente
+        self.feed = feed
+        self.indice = indice
+        self._visto = time.monotonic()
+        self._acordar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="precarga", daemon=True)
+        self._thread.start()
+
+    def tocar(self):
+        """
+        Há sessão ativa (chamado a cada rerun); acorda a thread se estava parada.
+        """
+        self._visto = time.monotonic()
+        self._acordar.set()
+
+    def _loop(self):
+        while True:
+            if time.monotonic() - self._visto > PRECARGA_OCIOSO_SEG:
+                self._acordar.clear()
+                self._acordar.wait()
+                continue
+            try:
+                with _metricas().medir("precarga", "rodada"):
+                    self.rodada()
+            except Exception as e:
+                log.warning("pré-carga: rodada falhou: %s", e)
+            time.sleep(PRECARGA_SEG)
+
+    def rodada(self):
+        # adiantada uma rodada: a busca acontece aqui, não na tela (o feed passa
+        # a ser buscado a cada FEED_POLL_SEG - PRECARGA_SEG)
+        self.feed.atualizar(self.cliente, antecedencia=PRECARGA_SEG)
+        self.indice.sincronizar(self.cliente, antecedencia=PRECARGA_SEG)
+
+        modelos = _modelos_checklist()
+        for tipo in ("MANGA", "PNM"):
+            try:
+                modelos.atual(tipo)
+            except KeyError:
+                pass
+
+        # especulativo: as primeiras séries da lista são as que o operador abre;
+        # o manifesto (e as URLs assinadas) ficam prontos para o painel de fotos
+        for linha in self.indice.pendentes().head(PRECARGA_SERIES).itertuples():
+            listar_fotos_da_serie(linha.numero_serie, linha.tipo_producao)
+
+
+@st.cache_resource
+def _precarga() -> PreCarga:
+    return PreCarga(supabase, _feed_apontamentos(), _indice_pendentes())
+
+
+# ==============================
+# ANÁLISE – AGREGADOS (rollups)
+# ==============================
+class RollupsProducao:
+    """
+    Agregados para a página de análise, em Parquet no disco do servidor:
+      producao_hora   → hora (UTC), tipo_producao, unidades
+      checklist_dia   → dia (local), tipo_producao, inspecoes, aprovadas
+      nc_dia          → dia (local), tipo_producao, item, complemento, qtd
+    atualizar() busca só o que entrou depois das marcas (id) e soma ao que já
+    existe; a tabela antiga de checklists é agregada uma vez só (não recebe mais linhas).
+    """
+
+    CHAVES = {
+        "producao_hora": ["hora", "tipo_producao"],
+        "checklist_dia": ["dia", "tipo_producao"],
+        "nc_dia": ["dia", "tipo_producao", "item", "complemento"],
+    }
+
+    def __init__(self, pasta: Path):
+        self.pasta = pasta
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._proxima = 0.0
+        self.marcas, self._geracao = self._ler_marcas()
+        self.tabelas = {nome: self._ler(nome) for nome in self.CHAVES}
+
+    def _ler_marcas(self) -> tuple[dict, str | None]:
+        caminho = self.pasta / "marcas.json"
+        if not caminho.exists():
+            return {}, None
+        dados = json.loads(caminho.read_text())
+        if "geracao" in dados:
+            return dados["marcas"], dados["geracao"]
+        return dados, None  # formato antigo: parquets soltos na pasta
+
+    def _ler(self, nome) -> pd.DataFrame:
+        base = self.pasta / self._geracao if self._geracao else self.pasta
+        caminho = base / f"{nome}.parquet"
+        if caminho.exists():
+            return pd.read_parquet(caminho)
+        return pd.DataFrame(columns=self.CHAVES[nome])
+
+    def _gravar(self):
+        """
+        Cada gravação vai para uma pasta nova (geração); só a troca do
+        marcas.json, por os.replace, a torna a atual. Cair no meio deixa a
+        geração anterior inteira: agregados e marcas nunca se desencontram
+        (o que somaria o mesmo delta duas vezes na próxima atualização).
+        """
+        geracao = f"g{time.time_ns()}"
+        pasta = self.pasta / geracao
+        pasta.mkdir()
+        for nome, df in self.tabelas.items():
+            df.to_parquet(pasta / f"{nome}.parquet", index=False)
+        tmp = self.pasta / "marcas.json.tmp"
+        tmp.write_text(json.dumps({"geracao": geracao, "marcas": self.marcas}))
+        os.replace(tmp, self.pasta / "marcas.json")
+        self._geracao = geracao
+
+        # gerações anteriores (inclusive restos de gravação interrompida) e o
+        # formato antigo; uma geração mais nova é de outro processo, fica
+        for antigo in self.pasta.iterdir():
+            if antigo.is_dir() and antigo.name.startswith("g") and antigo.name < geracao:
+                shutil.rmtree(antigo, ignore_errors=True)
+            elif antigo.suffix == ".parquet":
+                antigo.unlink(missing_ok=True)
+
+    def _somar(self, nome: str, novo: pd.DataFrame):
+        if novo.empty:
+            return
+        atual = self.tabelas[nome]
+        juntos = novo if atual.empty else pd.concat([atual, novo], ignore_index=True)
+        self.tabelas[nome] = juntos.groupby(self.CHAVES[nome], as_index=False, dropna=False).sum(numeric_only=True)
+
+    def atualizar(self, cliente, forcar: bool = False):
+        if not forcar and time.monotonic() < self._proxima:
+            return
+        # outra sessão já está atualizando → usa os agregados atuais
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            desde = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=ROLLUP_HISTORICO_DIAS)).isoformat()
+            self._delta_apontamentos(cliente, desde)
+            self._delta_checklists(cliente, desde)
+            if CHECKLIST_LER_FORMATO_ANTIGO and not self.marcas.get("legado_ok"):
+                self._carga_legado(cliente, desde)
+            self._gravar()
+            self._proxima = time.monotonic() + ROLLUP_DELTA_SEG
+        finally:
+            self._lock.release()
+
+    def _delta_apontamentos(self, cliente, desde: str):
+        marca = self.marcas.get("apontamentos_id", 0)
+        linhas = _selecionar_tudo(
+            lambda: cliente.table("apontamentos_manga_pnm")
+            .select("id, tipo_producao, data_hora")
+            .gt("id", marca)
+            .gte("data_hora", desde),
+            chave="id",
+        )
+        if not linhas:
+            return
+        df = pd.DataFrame(linhas)
+        df["hora"] = pd.to_datetime(df["data_hora"], utc=True, format="ISO8601").dt.floor("h")
+        df["unidades"] = 1
+        self._somar("producao_hora", df[["hora", "tipo_producao", "unidades"]])
+        self.marcas["apontamentos_id"] = int(df["id"].max())
+
+    def _delta_checklists(self, cliente, desde: str):
+        marca = self.marcas.get("checklists_id", 0)
+        linhas = _selecionar_tudo(
+            lambda: cliente.table(TABELA_CHECKLIST)
+            .select("id, tipo_producao, status_itens, complementos, modelo_versao, data_hora")
+            .gt("id", marca)
+            .gte("data_hora", desde),
+            chave="id",
+        )
+        if not linhas:
+            return
+        df = pd.DataFrame(linhas)
+        df["dia"] = _dia_local_serie(df["data_hora"])
+        df["inspecoes"] = 1
+        df["aprovadas"] = (~df["status_itens"].str.contains("N", regex=False)).astype(int)
+        self._somar("checklist_dia", df[["dia", "tipo_producao", "inspecoes", "aprovadas"]])
+
+        modelos = _modelos_checklist()
+        nc = [
+            {
+                "dia": r.dia,
+                "tipo_producao": r.tipo_producao,
+                "item": chave,
+                "complemento": (r.complementos or {}).get(chave, ""),
+                "qtd": 1,
+            }
+            for r in df.itertuples()
+            for chave, codigo in zip(
+                modelos.chaves(r.tipo_producao, None if pd.isna(r.modelo_versao) else r.modelo_versao, len(r.status_itens)),
+                r.status_itens,
+            )
+            if codigo == "N"
+        ]
+        self._somar("nc_dia", pd.DataFrame(nc, columns=self.CHAVES["nc_dia"] + ["qtd"]))
+        self.marcas["checklists_id"] = int(df["id"].max())
+
+    def _carga_legado(self, cliente, desde: str):
+        linhas = _selecionar_tudo(
+            lambda: cliente.table(TABELA_CHECKLIST_ANTIGA)
+            .select("id, numero_serie, tipo_producao, item, status, data_hora")
+            .gte("data_hora", desde)
+        )
+        if linhas:
+            df = pd.DataFrame(linhas)
+            df["dia"] = _dia_local_serie(df["data_hora"])
+            df["nc"] = (df["status"] == "Não Conforme").astype(int)
+
+            # uma inspeção = as linhas da série no dia
+            insp = df.groupby(["numero_serie", "tipo_producao", "dia"], as_index=False)["nc"].sum()
+            insp["inspecoes"] = 1
+            insp["aprovadas"] = (insp["nc"] == 0).astype(int)
+            self._somar("checklist_dia", insp[["dia", "tipo_producao", "inspecoes", "aprovadas"]])
+
+            nc = df[df["nc"] == 1].copy()
+            partes = nc["item"].str.split(" - ", n=1, expand=True).reindex(columns=[0, 1])
+            nc["item"] = partes[0]
+            nc["complemento"] = partes[1].fillna("")
+            nc["qtd"] = 1
+            self._somar("nc_dia", nc[self.CHAVES["nc_dia"] + ["qtd"]])
+        self.marcas["legado_ok"] = True
+
+    def consultar(self, nome: str, inicio: datetime.date, fim: datetime.date, tipo_producao: str | None = None) -> pd.DataFrame:
+        """
+        Recorte [inicio, fim] (datas locais) de um agregado.
+        """
+        df = self.tabelas[nome]
+        if df.empty:
+            return df.copy()
+        if nome == "producao_hora":
+            local = pd.to_datetime(df["hora"], utc=True).dt.tz_convert(TZ)
+            df = df.assign(hora=local)
+            datas = local.dt.date
+        else:
+            datas = pd.to_datetime(df["dia"]).dt.date
+        filtro = (datas >= inicio) & (datas <= fim)
+        if tipo_producao:
+            filtro &= df["tipo_producao"] == tipo_producao
+        return df[filtro].copy()
+
+
+def _dia_local_serie(data_hora: pd.Series) -> pd.Series:
+    return pd.to_datetime(data_hora, utc=True, format="ISO8601").dt.tz_convert(TZ).dt.strftime("%Y-%m-%d")
+
+
+@st.cache_resource
+def _rollups() -> RollupsProducao:
+    return RollupsProducao(ROLLUPS_PASTA)
+
+
+# ==============================
+# PÁGINA ANÁLISE
+# ==============================
+def _pareto(df: pd.DataFrame, coluna: str, titulo: str):
+    import plotly.graph_objects as go
+
+    contagem = df.groupby(coluna)["qtd"].sum().sort_values(ascending=False)
+    acumulado = contagem.cumsum() / contagem.sum() * 100
+    fig = go.Figure()
+    fig.add_bar(x=contagem.index, y=contagem.values, name="Não conformidades")
+    fig.add_scatter(x=acumulado.index, y=acumulado.values, name="% acumulado", yaxis="y2", mode="lines+markers")
+    fig.update_layout(
+        title=titulo,
+        yaxis2={"overlaying": "y", "side": "right", "range": [0, 105], "ticksuffix": "%"},
+        legend={"orientation": "h"},
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+def pagina_analise():
+    # plotly só é importado aqui: as páginas do leitor não pagam por ele
+    import plotly.express as px
+
+    st.title("📊 Análise de Produção")
+
+    rollups = _rollups()
+    try:
+        rollups.atualizar(supabase)
+    except Exception as e:
+        st.warning(f"⚠️ Não consegui atualizar os agregados (mostrando os últimos salvos): {e}")
+
+    hoje = datetime.datetime.now(TZ).date()
+    cols = st.columns([3, 2])
+    periodo = cols[0].date_input(
+        "Período",
+        (hoje - datetime.timedelta(days=30), hoje),
+        min_value=hoje - datetime.timedelta(days=ROLLUP_HISTORICO_DIAS),
+        max_value=hoje,
+    )
+    tipo = cols[1].selectbox("Tipo do Produto", ["Todos", "MANGA", "PNM"])
+    if not isinstance(periodo, (tuple, list)) or len(periodo) != 2:
+        st.info("Selecione início e fim do período")
+        return
+    inicio, fim = periodo
+    tipo = None if tipo == "Todos" else tipo
+
+    # --- Unidades por hora ---
+    prod = rollups.consultar("producao_hora", inicio, fim, tipo)
+    if prod.empty:
+        st.info("Sem apontamentos no período")
+    else:
+        st.subheader("📦 Unidades produzidas")
+        longo = (fim - inicio).days > 14
+        eixo = prod["hora"].dt.floor("D") if longo else prod["hora"]
+        serie = prod.assign(periodo=eixo).groupby(["periodo", "tipo_producao"], as_index=False)["unidades"].sum()
+        st.plotly_chart(
+            px.bar(serie, x="periodo", y="unidades", color="tipo_producao",
+                   labels={"periodo": "Dia" if longo else "Hora", "unidades": "Unidades"}),
+            use_container_width=True,
+        )
+
+        horas_ativas = prod.groupby(["hora", "tipo_producao"], as_index=False)["unidades"].sum()
+        media = horas_ativas.groupby("tipo_producao")["unidades"].mean()
+        for c, (t, v) in zip(st.columns(max(len(media), 1)), media.items()):
+            c.metric(f"{t} — unidades/hora (horas com produção)", f"{v:.1f}")
+
+    # --- First-pass yield ---
+    check = rollups.consultar("checklist_dia", inicio, fim, tipo)
+    if check.empty:
+        st.info("Sem checklists no período")
+        return
+
+    st.subheader("✅ Aprovação de primeira (FPY)")
+    total = check["inspecoes"].sum()
+    st.metric("FPY no período", f"{check['aprovadas'].sum() / total * 100:.1f}%", help=f"{total} inspeções")
+    fpy = check.groupby(["dia", "tipo_producao"], as_index=False)[["inspecoes", "aprovadas"]].sum()
+    fpy["fpy"] = fpy["aprovadas"] / fpy["inspecoes"] * 100
+    st.plotly_chart(
+        px.line(fpy, x="dia", y="fpy", color="tipo_producao", markers=True, labels={"dia": "Dia", "fpy": "FPY (%)"}),
+        use_container_width=True,
+    )
+
+    # --- Pareto de não conformidades ---
+    nc = rollups.consultar("nc_dia", inicio, fim, tipo)
+    if nc.empty:
+        st.success("Nenhuma não conformidade no período")
+        return
+
+    st.subheader("❌ Pareto de não conformidades")
+    _pareto(nc, "item", "Por item")
+    nc = nc.assign(item_complemento=nc["item"].where(nc["complemento"] == "", nc["item"] + " - " + nc["complemento"]))
+    _pareto(nc, "item_complemento", "Por item e complemento")
+
+
+# ==============================
+# IMPORTAÇÃO EM LOTE (linha de comando)
+# ==============================
+COLUNAS_IMPORTACAO = ["numero_serie", "op", "tipo_producao", "usuario", "data_hora"]
+IMPORTACAO_LOTE = 1000
+
+def _normaliza_codigos(s: pd.Series) -> pd.Series:
+    """
+    _normaliza_codigo vetorizado (colunas inteiras do pandas).
+    """
+    s = s.astype("string").fillna("").str.strip()
+    s = s.mask(s.str.lower() == "nan", "")
+    return s.str.replace(r"^(\d+)\.0$", r"\1", regex=True)
+
+def _ler_planilha(caminho: Path) -> pd.DataFrame:
+    if caminho.suffix.lower() in (".xlsx", ".xls"):
+        try:
+            return pd.read_excel(caminho, dtype=str)
+        except ImportError as e:
+            raise RuntimeError(f"Para ler {caminho.suffix} instale o openpyxl (pip install openpyxl): {e}")
+    return pd.read_csv(caminho, dtype=str, sep=None, engine="python")
+
+def preparar_importacao(df: pd.DataFrame, usuario_padrao: str = "Importacao") -> pd.DataFrame:
+    """
+    Normaliza e valida as linhas (sem rede). Coluna 'resultado' vazia = linha pronta para enviar.
+    """
+    faltando = [c for c in ("numero_serie", "op", "tipo_producao", "data_hora") if c not in df.columns]
+    if faltando:
+        raise RuntimeError(f"Colunas obrigatórias ausentes: {', '.join(faltando)}")
+
+    df = df.reindex(columns=COLUNAS_IMPORTACAO).copy()
+    df.insert(0, "linha", range(2, len(df) + 2))  # número da linha no arquivo (cabeçalho = 1)
+    for col in ("numero_serie", "op", "tipo_producao", "usuario"):
+        df[col] = _normaliza_codigos(df[col])
+    df["tipo_producao"] = df["tipo_producao"].str.upper()
+    df["usuario"] = df["usuario"].mask(df["usuario"] == "", usuario_padrao)
+
+    # sem fuso no arquivo = horário local da fábrica
+    texto = df["data_hora"].astype("string").fillna("").str.strip()
+    com_fuso = texto.str.contains(r"(?:Z|[+-]\d{2}:?\d{2})$", regex=True)
+    data_hora = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns, UTC]")
+    if com_fuso.any():
+        data_hora[com_fuso] = pd.to_datetime(texto[com_fuso], errors="coerce", utc=True, format="mixed")
+    if (~com_fuso).any():
+        data_hora[~com_fuso] = pd.to_datetime(texto[~com_fuso], errors="coerce", format="mixed") \
+            .dt.tz_localize(TZ, ambiguous="NaT", nonexistent="NaT") \
+            .dt.tz_convert("UTC")
+    df["data_hora"] = data_hora.map(lambda d: "" if pd.isna(d) else d.isoformat())
+
+    df["resultado"] = ""
+    df.loc[df["numero_serie"].str.len() != 9, "resultado"] = "erro: série deve ter 9 dígitos"
+    df.loc[(df["resultado"] == "") & (df["op"].str.len() != 11), "resultado"] = "erro: OP deve ter 11 dígitos"
+    df.loc[(df["resultado"] == "") & ~df["tipo_producao"].isin(["MANGA", "PNM"]), "resultado"] = "erro: tipo_producao inválido"
+    df.loc[(df["resultado"] == "") & (df["data_hora"] == ""), "resultado"] = "erro: data_hora inválida"
+
+    # só entre as válidas: uma linha com erro não tira a vez da seguinte com a mesma série
+    valida = df["resultado"] == ""
+    repetida = valida & df["numero_serie"].where(valida).duplicated(keep="first")
+    df.loc[repetida, "resultado"] = "duplicado no arquivo"
+    return df
+
+def importar_apontamentos(df: pd.DataFrame, cliente, lote: int = IMPORTACAO_LOTE, progresso=print) -> pd.DataFrame:
+    """
+    Envia as linhas válidas em upserts de `lote` linhas (on_conflict=numero_serie).
+    As que o servidor não devolve já existiam → 'duplicado'.
+    """
+    df = df.copy()
+    validos = df.index[df["resultado"] == ""]
+    for inicio in range(0, len(validos), lote):
+        idx = validos[inicio:inicio + lote]
+        registros = df.loc[idx, COLUNAS_IMPORTACAO].to_dict("records")
+        try:
+            res = cliente.table("apontamentos_manga_pnm").upsert(
+                registros, on_conflict="numero_serie", ignore_duplicates=True
+            ).execute()
+        except Exception as e:
+            df.loc[idx, "resultado"] = f"erro: {e}"
+            progresso(f"lote {inicio // lote + 1}: falhou ({e})")
+            continue
+
+        inseridas = {_normaliza_codigo(r["numero_serie"]) for r in (res.data or [])}
+        df.loc[idx, "resultado"] = df.loc[idx, "numero_serie"].map(
+            lambda s: "salvo" if s in inseridas else f"duplicado: Série {s} já apontada."
+        )
+        progresso(f"lote {inicio // lote + 1}: {len(inseridas)}/{len(idx)} novas")
+    return df
+
+def cli_importar(args) -> int:
+    caminho = Path(args.arquivo)
+    df = preparar_importacao(_ler_planilha(caminho), usuario_padrao=args.usuario)
+    inicio = time.perf_counter()
+    df = importar_apontamentos(df, supabase, lote=args.lote)
+
+    relatorio = Path(args.relatorio or caminho.with_name(f"{caminho.stem}_resultado.csv"))
+    df.to_csv(relatorio, index=False)
+
+    resumo = df["resultado"].str.split(":").str[0].value_counts()
+    print(f"{len(df)} linha(s) em {time.perf_counter() - inicio:.1f}s — relatório: {relatorio}")
+    for status, qtd in resumo.items():
+        print(f"  {status}: {qtd}")
+    return 0 if not df["resultado"].str.startswith("erro").any() else 1
+
+# ==============================
+# EXPORTAÇÃO EM BLOCOS (CSV / Parquet)
+# ==============================
+EXPORTACAO_BLOCO = POSTGREST_MAX_ROWS
+EXPORTACOES_PASTA = DADOS_LOCAIS / "exportacoes"
+EXPORTACOES_RETENCAO_HORAS = 24
+
+COLUNAS_EXPORTACAO = {
+    "apontamentos": ["numero_serie", "op", "tipo_producao", "usuario", "data_hora"],
+    "checklists": COLUNAS_CHECKLIST,
+}
+
+def blocos_exportacao(dados, desde_utc, ate_utc, tipo_producao=None, cliente=None, bloco=EXPORTACAO_BLOCO):
+    """
+    DataFrames de um bloco cada, com data_hora no fuso local. Checklists saem no formato
+    expandido (uma linha por item): primeiro o formato compacto, depois o antigo.
+    """
+    cliente = cliente or supabase
+    colunas = COLUNAS_EXPORTACAO[dados]
+    if dados == "apontamentos":
+        fontes = [("apontamentos_manga_pnm", ", ".join(colunas), lambda linhas: pd.DataFrame(linhas, columns=colunas))]
+    else:
+        fontes = [(TABELA_CHECKLIST, "numero_serie, tipo_producao, usuario, status_itens, complementos, modelo_versao, data_hora", expandir_checklists)]
+        if CHECKLIST_LER_FORMATO_ANTIGO:
+            fontes.append((TABELA_CHECKLIST_ANTIGA, ", ".join(colunas), lambda linhas: pd.DataFrame(linhas, columns=colunas)))
+
+    def consulta(tabela, selecao):
+        q = cliente.table(tabela).select(f"id, {selecao}").gte("data_hora", desde_utc).lt("data_hora", ate_utc)
+        return q.eq("tipo_producao", tipo_producao) if tipo_producao else q
+
+    for tabela, selecao, converter in fontes:
+        for linhas in paginas_keyset(lambda: consulta(tabela, selecao), bloco):
+            df = converter(linhas)
+            df["data_hora"] = pd.to_datetime(df["data_hora"], utc=True, format="ISO8601").dt.tz_convert(TZ)
+            yield df
+
+def exportar(destino, formato, dados, desde_utc, ate_utc, tipo_producao=None, cliente=None,
+             bloco=EXPORTACAO_BLOCO, progresso=print) -> int:
+    """
+    Grava CSV ou Parquet bloco a bloco (Parquet: um row group por bloco): a memória fica
+    em um bloco, qualquer que seja o período. Escreve em <destino>.parcial e só renomeia
+    no fim, então um arquivo com o nome final está sempre completo.
+    """
+    destino = Path(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    parcial = destino.with_name(destino.name + ".parcial")
+    colunas = COLUNAS_EXPORTACAO[dados]
+    blocos = blocos_exportacao(dados, desde_utc, ate_utc, tipo_producao, cliente, bloco)
+    total = 0
+
+    if formato == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        esquema = pa.schema([
+            (c, pa.timestamp("us", tz=TZ.zone) if c == "data_hora" else pa.string()) for c in colunas
+        ])
+        with pq.ParquetWriter(parcial, esquema) as arquivo:
+            for df in blocos:
+                arquivo.write_table(pa.Table.from_pandas(df[colunas], schema=esquema, preserve_index=False))
+                total += len(df)
+                progresso(f"{total} linha(s)")
+    else:
+        with open(parcial, "w", newline="", encoding="utf-8") as arquivo:
+            arquivo.write(",".join(colunas) + "\n")
+            for df in blocos:
+                df[colunas].to_csv(arquivo, header=False, index=False)
+                total += len(df)
+                progresso(f"{total} linha(s)")
+
+    os.replace(parcial, destino)
+    return total
+
+def _limpar_exportacoes(horas: int = EXPORTACOES_RETENCAO_HORAS):
+    limite = time.time() - horas * 3600
+    for arquivo in EXPORTACOES_PASTA.glob("*"):
+        if arquivo.is_file() and arquivo.stat().st_mtime < limite:
+            arquivo.unlink(missing_ok=True)
+
+def pagina_exportacao():
+    st.title("📤 Exportação")
+
+    hoje = datetime.datetime.now(TZ).date()
+    cols = st.columns([3, 2, 2, 2])
+    periodo = cols[0].date_input("Período", (hoje - datetime.timedelta(days=30), hoje), max_value=hoje)
+    dados = cols[1].selectbox("Dados", list(COLUNAS_EXPORTACAO))
+    tipo = cols[2].selectbox("Tipo do Produto", ["Todos", "MANGA", "PNM"])
+    formato = cols[3].selectbox("Formato", ["csv", "parquet"])
+    if not isinstance(periodo, (tuple, list)) or len(periodo) != 2:
+        st.info("Selecione início e fim do período")
+        return
+    inicio, fim = periodo
+    tipo = None if tipo == "Todos" else tipo
+
+    if st.button("Gerar arquivo", type="primary"):
+        _limpar_exportacoes()
+        nome = f"{dados}_{inicio:%Y%m%d}_{fim:%Y%m%d}{'_' + tipo if tipo else ''}.{formato}"
+        aviso = st.empty()
+        try:
+            total = exportar(
+                EXPORTACOES_PASTA / nome, formato, dados, *_intervalo_utc(inicio, fim), tipo,
+                progresso=lambda msg: aviso.caption(f"⏳ {msg}"),
+            )
+        except Exception as e:
+            aviso.empty()
+            st.error(f"❌ Falha na exportação: {e}")
+            return
+        aviso.empty()
+        st.session_state["exportacao"] = (nome, total)
+
+    if st.session_state.get("exportacao"):
+        nome, total = st.session_state["exportacao"]
+        caminho = EXPORTACOES_PASTA / nome
+        if caminho.exists():
+            st.success(f"✅ {total} linha(s) — {nome} ({caminho.stat().st_size / 1e6:.1f} MB)")
+            # o arquivo só é lido do disco quando o botão é clicado
+            st.download_button(
+                "⬇️ Baixar", data=caminho.read_bytes, file_name=nome,
+                mime="text/csv" if nome.endswith(".csv") else "application/octet-stream",
+                on_click="ignore",
+            )
+
+def cli_exportar(args) -> int:
+    if args.bloco < 1:
+        print("--bloco precisa ser um número de linhas maior que zero")
+        return 2
+    saida = Path(args.saida)
+    formato = args.formato or ("parquet" if saida.suffix.lower() == ".parquet" else "csv")
+    desde_utc, ate_utc = _intervalo_utc(datetime.date.fromisoformat(args.de), datetime.date.fromisoformat(args.ate))
+
+    inicio = time.perf_counter()
+    total = exportar(
+        saida, formato, args.dados, desde_utc, ate_utc, args.tipo_producao, bloco=args.bloco,
+        progresso=lambda msg: print(f"\r{msg}", end="", flush=True),
+    )
+    print(f"\r{total} linha(s) em {time.perf_counter() - inicio:.1f}s — {saida}")
+    return 0
+
+# ==============================
+# BENCHMARK (backend local)
+# ==============================
+def _medir(funcao, n: int) -> list[float]:
+    amostras = []
+    for i in range(n):
+        inicio = time.perf_counter()
+        funcao(i)
+        amostras.append((time.perf_counter() - inicio) * 1000)
+    return amostras
+
+def _foto_teste() -> bytes:
+    if not _tem_pillow():
+        return os.urandom(200_000)
+    from PIL import Image
+
+    img = Image.effect_noise((3000, 2000), 64).convert("RGB")
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=92)
+    return out.getvalue()
+
+def executar_benchmark(n: int = 50) -> dict:
+    """
+    p50/p95/p99 (ms) dos caminhos quentes, contra o ClienteLocal (BACKEND=local).
+    Callback e página são chamados direto (Streamlit sem servidor, session_state
+    local): um rerun pelo streamlit.testing mediria sobretudo a compilação do script.
+    """
+    base = random.randint(100_000_000, 899_999_999 - 10 * n)
+    agora = datetime.datetime.now(datetime.timezone.utc)
+    # um dia de linha já apontado, metade com checklist
+    supabase.table("apontamentos_manga_pnm").insert([
+        {"numero_serie": str(base + i), "op": "12345678901", "tipo_producao": random.choice(["MANGA", "PNM"]),
+         "usuario": "bench", "data_hora": (agora - datetime.timedelta(minutes=i)).isoformat()}
+        for i in range(n * 4)
+    ]).execute()
+    respostas = {i: "✅" for i in range(1, len(_modelos_checklist().atual("MANGA").itens) + 1)}
+    for i in range(0, n * 4, 2):
+        salvar_checklist(str(base + i), "MANGA", "bench", respostas, {})
+
+    resultados = {}
+
+    # 1) leitura série + OP → confirmação (o callback do leitor)
+    serie_bench = base + n * 4
+    st.session_state["tipo_producao"] = "MANGA"
+
+    def leitura(i):
+        st.session_state["input_leitor"] = str(serie_bench + i)
+        processar_leitura()
+        st.session_state["input_leitor"] = "12345678901"
+        st.session_state["sucesso"] = None
+        inicio = time.perf_counter()
+        processar_leitura()
+        leitura.amostras.append((time.perf_counter() - inicio) * 1000)
+        if not st.session_state.get("sucesso"):
+            raise RuntimeError(f"leitura {i} não confirmou: {st.session_state.get('erro')}")
+    leitura.amostras = []
+    for i in range(n):
+        leitura(i)
+    resultados["processar_leitura"] = _percentis(leitura.amostras)
+    resultados["salvar_apontamento"] = _percentis(_medir(
+        lambda i: salvar_apontamento(str(serie_bench + n + i), "12345678901", "PNM", "bench"), n
+    ))
+
+    # 2) checklist
+    resultados["salvar_checklist"] = _percentis(_medir(
+        lambda i: salvar_checklist(str(base + 1 + 2 * (i % (n * 2))), "PNM", "bench", respostas, {4: "Aço"}), n
+    ))
+
+    # 3) foto: enfileirar (o que o formulário paga) e até 'enviado' (Storage + tabela)
+    fila = _fila_fotos()
+    concluidas = {}
+    fila.ao_mudar(lambda t: t["status"] in ("enviado", "falha") and concluidas.setdefault(t["id"], time.perf_counter()))
+    # uma foto diferente por amostra: o mesmo conteúdo na mesma série cairia na deduplicação
+    fotos = [_foto_teste() for _ in range(max(n // 5, 2))]
+    enfileirar, ate_enviado = [], []
+    for foto in fotos:
+        inicio = time.perf_counter()
+        tarefa = fila.enfileirar(str(base), "MANGA", "12345678901", "bench", "vista_superior", "image/jpeg", foto)
+        if tarefa.get("repetida"):
+            raise RuntimeError("foto do benchmark caiu na deduplicação")
+        enfileirar.append((time.perf_counter() - inicio) * 1000)
+        while tarefa["id"] not in concluidas:
+            time.sleep(0.005)
+        ate_enviado.append((concluidas[tarefa["id"]] - inicio) * 1000)
+    resultados["foto: enfileirar"] = _percentis(enfileirar)
+    resultados["foto: até enviada"] = _percentis(ate_enviado)
+
+    # 4) página Checklist (lista de pendentes + formulário da 1ª série)
+    resultados["pagina_checklist"] = _percentis(_medir(lambda i: pagina_checklist(), n))
+    return resultados
+
+def cli_benchmark(args) -> int:
+    if BACKEND != "local":
+        print('O benchmark roda só contra o backend local: BACKEND=local python "manga e pnm.py" benchmark')
+        return 2
+
+    # widgets fora do `streamlit run` avisam a cada chamada; aqui só interessa o tempo.
+    # A configuração é lida antes: ao ser lida ela reporia o nível do log
+    from streamlit import config as st_config, logger as st_logger
+    st_config.get_config_options()
+    st_logger.set_log_level("error")
+
+    local = supabase.interno.interno  # Instrumentado → Resiliente → ClienteLocal
+    local.latencia_ms = args.latencia_ms
+    local.variacao_ms = args.variacao_ms
+    resultados = executar_benchmark(args.n)
+
+    print(f"backend local — latência {args.latencia_ms:.0f} ms (+ até {args.variacao_ms:.0f} ms)")
+    print(f"{'operação':<28}{'n':>5}{'p50':>10}{'p95':>10}{'p99':>10}   (ms)")
+    for nome, r in resultados.items():
+        print(f"{nome:<28}{r['n']:>5}{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}")
+
+    # onde o tempo foi: o mesmo histograma do painel de admin (janela recente por operação)
+    backend = supabase.metricas.resumo()
+    print()
+    print(f"{'operação / tabela':<48}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for r in backend:
+        nome = f"{r['operacao']} {r['tabela']}".strip()
+        print(f"{nome:<48}{r['n']:>6}{r['p50']:>10.1f}{r['p95']:>10.1f}{r['p99']:>10.1f}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            "data_hora": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "latencia_ms": args.latencia_ms,
+            "variacao_ms": args.variacao_ms,
+            "resultados": resultados,
+            "metricas": backend,
+        }, indent=2, ensure_ascii=False))
+    return 0
+
+def cli(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog="manga e pnm.py", description="Ferramentas de linha de comando MANGA / PNM")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("importar", help="Importa apontamentos de CSV/XLSX (numero_serie, op, tipo_producao, usuario, data_hora)")
+    p.add_argument("arquivo")
+    p.add_argument("--relatorio", help="CSV de saída com o resultado por linha (padrão: <arquivo>_resultado.csv)")
+    p.add_argument("--lote", type=int, default=IMPORTACAO_LOTE)
+    p.add_argument("--usuario", default="Importacao", help="usuário para linhas sem usuario")
+    p.set_defaults(func=cli_importar)
+
+    p = sub.add_parser("exportar", help="Exporta apontamentos ou checklists de um período em CSV/Parquet")
+    p.add_argument("dados", choices=list(COLUNAS_EXPORTACAO))
+    p.add_argument("saida", help="arquivo de saída (.csv ou .parquet)")
+    p.add_argument("--de", required=True, help="primeiro dia (AAAA-MM-DD, horário local)")
+    p.add_argument("--ate", required=True, help="último dia, incluso (AAAA-MM-DD)")
+    p.add_argument("--tipo-producao", choices=["MANGA", "PNM"])
+    p.add_argument("--formato", choices=["csv", "parquet"], help="padrão: pela extensão da saída")
+    p.add_argument("--bloco", type=int, default=EXPORTACAO_BLOCO, help="linhas por requisição (limitado a POSTGREST_MAX_ROWS)")
+    p.set_defaults(func=cli_exportar)
+
+    p = sub.add_parser("benchmark", help="p50/p95/p99 dos caminhos quentes contra o backend local (BACKEND=local)")
+    p.add_argument("--n", type=int, default=50, help="amostras por operação")
+    p.add_argument("--latencia-ms", type=float, default=LATENCIA_LOCAL_MS, help="latência simulada por chamada")
+    p.add_argument("--variacao-ms", type=float, default=LATENCIA_LOCAL_VARIACAO_MS, help="variação aleatória somada à latência")
+    p.add_argument("--json", help="grava os resultados em JSON (para comparar entre versões)")
+    p.set_defaults(func=cli_benchmark)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+COMANDOS_CLI = {"importar", "exportar", "benchmark"}
+
 # ==============================
 # APP
 # ==============================
@@ -591,13 +4323,26 @@ def app():
     if "usuario" not in st.session_state:
         st.session_state["usuario"] = "Operador_Logado"
 
-    menu = st.sidebar.radio("Menu", ["Apontamento", "Checklist"])
-    if menu == "Apontamento":
-        pagina_apontamento()
-    else:
-        pagina_checklist()
+    _exportador_metricas()
+    _precarga().tocar()
+    menu = st.sidebar.radio("Menu", ["Apontamento", "Checklist", "Análise", "Exportação"])
+    with _metricas().medir("pagina", menu):
+        if menu == "Apontamento":
+            pagina_apontamento()
+        elif menu == "Checklist":
+            pagina_checklist()
+        elif menu == "Análise":
+            pagina_analise()
+        else:
+            pagina_exportacao()
+
+    if METRICAS_PAINEL:
+        painel_metricas()
 
 if __name__ == "__main__":
+    # python "manga e pnm.py" <comando> ... → ferramentas de linha de comando; senão, a página
+    if len(sys.argv) > 1 and sys.argv[1] in COMANDOS_CLI:
+        sys.exit(cli(sys.argv[1:]))
     app()
 
 
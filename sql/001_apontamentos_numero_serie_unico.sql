@@ -0,0 +1,7 @@
+-- Garante uma linha por série em apontamentos_manga_pnm.
+-- Necessário para o upsert com on_conflict=numero_serie (envio em lote do journal).
+-- Antes de aplicar, confira se não há séries repetidas:
+--   select numero_serie, count(*) from apontamentos_manga_pnm group by 1 having count(*) > 1;
+
+alter table public.apontamentos_manga_pnm
+    add constraint apontamentos_manga_pnm_numero_serie_key unique (numero_serie);
@@ -0,0 +1,6 @@
+-- Miniatura gerada no tablet antes do upload (mesma pasta tipo/serie/ da foto).
+-- As telas de debug/galeria carregam só a miniatura.
+
+alter table public.checklists_manga_pnm_fotos
+    add column if not exists thumb_path text,
+    add column if not exists thumb_url text;
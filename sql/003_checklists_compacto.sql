@@ -0,0 +1,17 @@
+-- Checklist compacto: uma linha por inspeção (antes: 14–15 linhas em checklists_manga_pnm_detalhes).
+-- status_itens: um caractere por item, na ordem de ITEM_KEYS
+--   C = Conforme, N = Não Conforme, A = N/A, - = item não perguntado
+-- complementos: {"RODAGEM": "Aço", "SOLDA": "Porosidade", ...}
+
+create table if not exists public.checklists_manga_pnm (
+    id bigint generated always as identity primary key,
+    numero_serie text not null,
+    tipo_producao text not null,
+    usuario text,
+    status_itens text not null,
+    complementos jsonb not null default '{}'::jsonb,
+    data_hora timestamptz not null default now()
+);
+
+create index if not exists checklists_manga_pnm_data_hora_idx
+    on public.checklists_manga_pnm (data_hora);
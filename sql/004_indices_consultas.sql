@@ -0,0 +1,25 @@
+-- Índices das consultas por período e por série.
+-- A paginação por chave ordena por (data_hora, id) e continua depois do último par visto:
+-- com o índice composto cada página é uma descida no índice, qualquer que seja o tamanho da tabela.
+-- Em tabela grande e em uso, prefira rodar cada um como "create index concurrently" (fora de transação).
+
+-- apontamentos: numero_serie já tem índice único (001)
+create index if not exists apontamentos_manga_pnm_data_hora_id_idx
+    on public.apontamentos_manga_pnm (data_hora, id);
+
+-- checklists (formato compacto): substitui o índice só em data_hora criado na 003
+create index if not exists checklists_manga_pnm_data_hora_id_idx
+    on public.checklists_manga_pnm (data_hora, id);
+drop index if exists public.checklists_manga_pnm_data_hora_idx;
+create index if not exists checklists_manga_pnm_numero_serie_data_hora_idx
+    on public.checklists_manga_pnm (numero_serie, data_hora);
+
+-- checklists (formato antigo, 1 linha por item), enquanto ainda for lido
+create index if not exists checklists_manga_pnm_detalhes_data_hora_id_idx
+    on public.checklists_manga_pnm_detalhes (data_hora, id);
+create index if not exists checklists_manga_pnm_detalhes_numero_serie_data_hora_idx
+    on public.checklists_manga_pnm_detalhes (numero_serie, data_hora);
+
+-- fotos: painel da série pagina por (data_hora, storage_path)
+create index if not exists checklists_manga_pnm_fotos_numero_serie_data_hora_idx
+    on public.checklists_manga_pnm_fotos (numero_serie, data_hora desc, storage_path desc);
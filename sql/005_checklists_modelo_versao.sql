@@ -0,0 +1,6 @@
+-- Versão do modelo de checklist (modelos_checklist/<TIPO>_v<N>.json) usada em cada inspeção.
+-- status_itens segue a ordem dos itens dessa versão; linhas sem versão (de antes) = versão 1.
+-- Aplique antes de subir a versão do app que grava/lê a coluna.
+
+alter table public.checklists_manga_pnm
+    add column if not exists modelo_versao integer;
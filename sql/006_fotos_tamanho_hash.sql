@@ -0,0 +1,6 @@
+-- Tamanho (bytes) e sha256 do arquivo enviado, gravados pela fila de fotos.
+-- O painel confere o bucket contra a tabela sem baixar nada; fotos antigas ficam null.
+
+alter table public.checklists_manga_pnm_fotos
+    add column if not exists tamanho bigint,
+    add column if not exists sha256 text;
@@ -0,0 +1,5 @@
+-- Antes de subir uma foto, a fila procura o mesmo conteúdo já registrado na série
+-- (numero_serie + sha256): toque duplo ou nova tentativa depois de timeout não sobem de novo.
+
+create index if not exists checklists_manga_pnm_fotos_serie_sha256_idx
+    on public.checklists_manga_pnm_fotos (numero_serie, sha256);
@@ -0,0 +1,11 @@
+-- Chave de idempotência do checklist: o formulário gera uma por inspeção e manda
+-- a mesma ao salvar de novo (depois de erro ou de resposta perdida); o upsert com
+-- on_conflict=chave e ignore_duplicates não grava a inspeção duas vezes.
+-- Linhas antigas ficam com chave nula (nulos não conflitam no índice único).
+-- Aplique antes de subir a versão do app que grava a coluna.
+
+alter table public.checklists_manga_pnm
+    add column if not exists chave text;
+
+create unique index if not exists checklists_manga_pnm_chave_key
+    on public.checklists_manga_pnm (chave);
@@ -0,0 +1,32 @@
+"""
+O app é um arquivo só, com espaço no nome: os testes o carregam pelo caminho,
+com o backend local (sem rede) e os dados locais numa pasta temporária.
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+APP = Path(__file__).resolve().parent.parent / "manga e pnm.py"
+
+
+@pytest.fixture(scope="session")
+def app():
+    os.environ["BACKEND"] = "local"
+    os.environ["DADOS_LOCAIS"] = tempfile.mkdtemp(prefix="manga_pnm_testes_")
+    spec = importlib.util.spec_from_file_location("manga_pnm", APP)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules["manga_pnm"] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+@pytest.fixture
+def cliente(app):
+    """
+    Backend em memória novo por teste, com o mesmo max-rows do app.
+    """
+    return app.ClienteLocal(max_linhas=app.POSTGREST_MAX_ROWS)
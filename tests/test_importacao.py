@@ -0,0 +1,100 @@
+import pandas as pd
+import pytest
+
+
+def _planilha(**colunas):
+    base = {
+        "numero_serie": ["123456789"],
+        "op": ["12345678901"],
+        "tipo_producao": ["MANGA"],
+        "usuario": ["ANA"],
+        "data_hora": ["2026-03-10 08:00:00"],
+    }
+    base.update(colunas)
+    return pd.DataFrame(base, dtype=str)
+
+
+def test_preparar_importacao_normaliza_codigos_do_excel(app):
+    df = app.preparar_importacao(_planilha(numero_serie=["123456789.0"], op=[" 12345678901 "], tipo_producao=["pnm"], usuario=[None]))
+
+    linha = df.iloc[0]
+    assert linha["numero_serie"] == "123456789"
+    assert linha["op"] == "12345678901"
+    assert linha["tipo_producao"] == "PNM"
+    assert linha["usuario"] == "Importacao"
+    assert linha["resultado"] == ""
+
+
+def test_preparar_importacao_data_sem_fuso_e_horario_local(app):
+    df = app.preparar_importacao(_planilha(
+        numero_serie=["123456789", "123456780"],
+        op=["12345678901"] * 2,
+        tipo_producao=["MANGA"] * 2,
+        usuario=["ANA"] * 2,
+        data_hora=["2026-03-10 08:00:00", "2026-03-10T08:00:00Z"],
+    ))
+
+    assert df["data_hora"].tolist() == ["2026-03-10T11:00:00+00:00", "2026-03-10T08:00:00+00:00"]
+
+
+def test_preparar_importacao_marca_linhas_invalidas_e_repetidas(app):
+    df = app.preparar_importacao(_planilha(
+        numero_serie=["12345678", "123456789", "123456788", "123456787", "123456786"],
+        op=["12345678901", "1234", "12345678901", "12345678901", "12345678901"],
+        tipo_producao=["MANGA", "MANGA", "EIXO", "MANGA", "MANGA"],
+        usuario=["ANA"] * 5,
+        data_hora=["2026-03-10 08:00"] * 3 + ["ontem", "2026-03-10 08:00"],
+    ))
+
+    assert df["linha"].tolist() == [2, 3, 4, 5, 6]
+    assert df["resultado"].tolist() == [
+        "erro: série deve ter 9 dígitos",
+        "erro: OP deve ter 11 dígitos",
+        "erro: tipo_producao inválido",
+        "erro: data_hora inválida",
+        "",
+    ]
+
+
+def test_preparar_importacao_duplicada_no_arquivo(app):
+    df = app.preparar_importacao(_planilha(
+        numero_serie=["123456789", "123456789"],
+        op=["12345678901"] * 2,
+        tipo_producao=["MANGA"] * 2,
+        usuario=["ANA"] * 2,
+        data_hora=["2026-03-10 08:00"] * 2,
+    ))
+
+    assert df["resultado"].tolist() == ["", "duplicado no arquivo"]
+
+
+def test_preparar_importacao_linha_com_erro_nao_conta_como_primeira(app):
+    df = app.preparar_importacao(_planilha(
+        numero_serie=["123456789", "123456789"],
+        op=["1234", "12345678901"],
+        tipo_producao=["MANGA"] * 2,
+        usuario=["ANA"] * 2,
+        data_hora=["2026-03-10 08:00"] * 2,
+    ))
+
+    assert df["resultado"].tolist() == ["erro: OP deve ter 11 dígitos", ""]
+
+
+def test_preparar_importacao_exige_colunas(app):
+    with pytest.raises(RuntimeError, match="op"):
+        app.preparar_importacao(pd.DataFrame({"numero_serie": ["123456789"], "tipo_producao": ["MANGA"], "data_hora": ["x"]}))
+
+
+def test_importar_apontamentos_marca_as_que_ja_existiam(app, cliente):
+    cliente.table("apontamentos_manga_pnm").insert({"numero_serie": "123456789", "op": "1"}).execute()
+    df = app.preparar_importacao(_planilha(
+        numero_serie=["123456789", "123456780"],
+        op=["12345678901"] * 2,
+        tipo_producao=["MANGA"] * 2,
+        usuario=["ANA"] * 2,
+        data_hora=["2026-03-10 08:00"] * 2,
+    ))
+
+    df = app.importar_apontamentos(df, cliente, progresso=lambda *_: None)
+
+    assert df["resultado"].tolist() == ["duplicado: Série 123456789 já apontada.", "salvo"]
@@ -0,0 +1,30 @@
+import datetime
+
+
+def test_janela_utc_dia_inteiro(app):
+    assert app.janela_utc(datetime.date(2026, 3, 10)) == (
+        "2026-03-10T03:00:00+00:00",
+        "2026-03-11T03:00:00+00:00",
+    )
+
+
+def test_janela_utc_turno_da_noite_termina_no_dia_seguinte(app):
+    desde, ate = app.janela_utc(datetime.date(2026, 3, 10), datetime.time(22), datetime.time(6))
+
+    assert desde == "2026-03-11T01:00:00+00:00"
+    assert ate == "2026-03-11T09:00:00+00:00"
+
+
+def test_janela_utc_fim_do_horario_de_verao_antigo(app):
+    # 18/02/2018 à meia-noite o relógio voltou para 23h: o dia 17 teve 25 horas
+    desde, ate = app.janela_utc(datetime.date(2018, 2, 17))
+
+    assert desde == "2018-02-17T02:00:00+00:00"
+    assert ate == "2018-02-18T03:00:00+00:00"
+
+
+def test_intervalo_utc_inclui_o_ultimo_dia(app):
+    assert app._intervalo_utc(datetime.date(2026, 3, 10), datetime.date(2026, 3, 12)) == (
+        "2026-03-10T03:00:00+00:00",
+        "2026-03-13T03:00:00+00:00",
+    )
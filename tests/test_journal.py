@@ -0,0 +1,65 @@
+import datetime
+import time
+import uuid
+
+import pytest
+
+
+def _registro(numero_serie, op="12345678901", usuario="OPERADOR"):
+    return {
+        "chave": uuid.uuid4().hex,
+        "numero_serie": numero_serie,
+        "op": op,
+        "tipo_producao": "MANGA",
+        "usuario": usuario,
+        "data_hora": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+@pytest.fixture
+def journal(app, tmp_path):
+    return app.JournalApontamentos(tmp_path / "journal.db")
+
+
+def _esperar_envio(journal, series, prazo_seg=5):
+    limite = time.monotonic() + prazo_seg
+    while time.monotonic() < limite:
+        situacao = journal.situacao(series)
+        if all(situacao[s]["status"] != "pendente" for s in series):
+            return {s: situacao[s]["status"] for s in series}
+        time.sleep(0.02)
+    raise AssertionError(f"journal não esvaziou: {journal.situacao(series)}")
+
+
+def test_journal_recusa_serie_repetida(journal):
+    assert journal.registrar(_registro("100000001"))
+    assert not journal.registrar(_registro("100000001"))
+
+
+def test_journal_lote_devolve_so_as_novas(journal):
+    journal.registrar(_registro("100000001"))
+
+    gravadas = journal.registrar_lote([_registro("100000001"), _registro("100000002")])
+
+    assert gravadas == {"100000002"}
+
+
+def test_flusher_separa_duplicadas_de_resposta_perdida(app, cliente, journal):
+    nossa = _registro("100000002")
+    journal.registrar(_registro("100000001"))
+    journal.registrar(nossa)
+    journal.registrar(_registro("100000003"))
+    # 100000001: outro posto apontou antes; 100000002: nosso envio anterior gravou, a resposta se perdeu
+    cliente.table("apontamentos_manga_pnm").insert([
+        {**_registro("100000001", op="99999999999", usuario="OUTRO_POSTO")},
+        {k: nossa[k] for k in ("numero_serie", "op", "tipo_producao", "usuario", "data_hora")},
+    ]).execute()
+
+    indice = app.IndiceSeries()
+    app.FlusherApontamentos(journal, cliente, app.FeedApontamentos(), indice)
+    status = _esperar_envio(journal, ["100000001", "100000002", "100000003"])
+
+    assert status == {"100000001": "duplicado", "100000002": "enviado", "100000003": "enviado"}
+    no_servidor = cliente.table("apontamentos_manga_pnm").select("numero_serie").execute().data
+    assert sorted(l["numero_serie"] for l in no_servidor) == ["100000001", "100000002", "100000003"]
+    assert indice.conferir(["100000001", "100000002", "100000003"]) == {"100000001", "100000002", "100000003"}
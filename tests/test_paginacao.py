@@ -0,0 +1,59 @@
+import datetime
+
+
+def _apontamentos(cliente, n, mesma_hora_a_cada=1):
+    base = datetime.datetime(2026, 3, 10, 12, tzinfo=datetime.timezone.utc)
+    cliente.table("apontamentos_manga_pnm").insert([
+        {
+            "numero_serie": str(100000000 + i),
+            "op": "12345678901",
+            "tipo_producao": "MANGA",
+            "data_hora": (base + datetime.timedelta(seconds=i // mesma_hora_a_cada)).isoformat(),
+        }
+        for i in range(n)
+    ]).execute()
+
+
+def test_paginas_keyset_traz_tudo_sem_pagina_vazia_no_fim(app, cliente):
+    _apontamentos(cliente, 2500)
+    cliente.chamadas.clear()
+
+    paginas = list(app.paginas_keyset(lambda: cliente.table("apontamentos_manga_pnm").select("id, data_hora"), 1000))
+
+    assert [len(p) for p in paginas] == [1000, 1000, 500]
+    assert [l["id"] for p in paginas for l in p] == list(range(1, 2501))
+    assert cliente.chamadas[("apontamentos_manga_pnm", "select")] == 3
+
+
+def test_paginas_keyset_limita_a_pagina_ao_max_rows(app, cliente):
+    _apontamentos(cliente, 2500)
+
+    linhas = app._selecionar_tudo(lambda: cliente.table("apontamentos_manga_pnm").select("id, data_hora"), 5000)
+
+    assert len(linhas) == 2500
+
+
+def test_pagina_keyset_desempata_pelo_id(app, cliente):
+    # quatro linhas por segundo: o corte da página cai no meio de um empate em data_hora
+    _apontamentos(cliente, 10, mesma_hora_a_cada=4)
+
+    def consulta():
+        return cliente.table("apontamentos_manga_pnm").select("id, data_hora")
+
+    vistos, cursor = [], None
+    while True:
+        linhas, cursor = app.pagina_keyset(consulta, cursor, 3, desc=True)
+        vistos += [l["id"] for l in linhas]
+        if cursor is None:
+            break
+
+    assert vistos == list(range(10, 0, -1))
+
+
+def test_pagina_keyset_ultima_pagina_sem_cursor(app, cliente):
+    _apontamentos(cliente, 5)
+
+    linhas, cursor = app.pagina_keyset(lambda: cliente.table("apontamentos_manga_pnm").select("id, data_hora"), None, 10)
+
+    assert len(linhas) == 5
+    assert cursor is None